@@ -2,11 +2,10 @@ import sys
 import os
 import shutil
 import openpyxl
-import stat
 import logging
 import asyncio
-import aiofiles
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTabWidget, QSizePolicy, QTextEdit, QSpacerItem, QMessageBox, QMenu, QProgressBar
+import multiprocessing
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTabWidget, QSizePolicy, QTextEdit, QSpacerItem, QMessageBox, QMenu, QProgressBar, QSpinBox, QCheckBox
 from PySide6.QtGui import QPixmap, QIcon, QPalette, QColor, QFont, QPainter, QPolygon, QAction
 from PySide6.QtCore import Qt, QProcess, QThread, Signal, QPoint, QTimer
 from openpyxl import Workbook
@@ -14,9 +13,23 @@ from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 import time
 import pygame
-
-# Initialize pygame for sound
-pygame.mixer.init()
+from kathana_pack import run_pack_jobs
+from kathana_store import ObjectStore, link_plan_from_store
+from kathana_diff import diff_versions, save_diff, format_diff, load_delta, filter_plan_to_delta
+from kathana_fbx import NOESIS_FLAGS, NOESIS_ANIMS_PER_JOB, FbxBuildState, FbxCache, plan_fbx_version, plan_fbx_from_copy_plan, \
+    create_output_folders, split_outdated, format_fbx_cache_stats, group_animations
+from kathana_digest import DigestCache
+from kathana_metrics import load_metrics, fit_cost_model, estimate_job_seconds, predict_run_seconds
+from kathana_shard import write_shards, format_shards
+from kathana_jobspec import plan_job_specs, save_job_specs, export_job_specs
+from kathana_noesis import NOESIS_WORKERS, run_noesis_jobs, format_run_summary, failure_report, \
+    format_failure_report, effective_anims_per_job
+from kathana_skeleton import SkeletonIndex, filter_compatible_pairs, save_skipped_pairs, format_skipped_pairs
+from kathana_pipeline import run_copy_convert_pipeline, format_pipeline_stats
+from kathana_dupes import find_duplicates, save_duplicates, load_duplicates, format_duplicates, duplicate_names, \
+    dedupe_copy_plan, link_duplicate_copies
+from kathana_copy import CopyThrottle, format_rate, plan_entity_copies, order_copy_jobs, run_copy_jobs, \
+    choose_copy_policy, DevicePools, create_destination_folders, record_copy_run, estimate_plans, format_plan_estimate
 
 # Define the base path to resource files
 def resource_path(relative_path):
@@ -68,10 +81,13 @@ def ensure_directory_exists(path):
         os.makedirs(path)
         logger.debug(f"Created directory: {path}")
 
-ensure_directory_exists(os.path.dirname(LOG_XLSX_PATH))
-wb_log = initialize_log_workbook()
-error_log_ws = wb_log['ERROR_LOGS']
-success_log_ws = wb_log['SUCCESS_LOGS']
+# Created in __main__, so digest worker processes re-importing this module leave the log workbook alone
+wb_log = None
+error_log_ws = None
+success_log_ws = None
+
+# Shared bandwidth/IOPS limiter for copy jobs, adjustable from the GUI while a job runs
+copy_throttle = CopyThrottle()
 
 # Log error messages to both the console and the log workbook
 def log_error(message):
@@ -85,158 +101,384 @@ def log_success(message):
     success_log_ws.append([message])
     wb_log.save(LOG_XLSX_PATH)
 
-# Asynchronously copy files with a semaphore to limit concurrency
-async def copy_file_async(src_file, dest_file, semaphore):
-    logger.debug(f"Attempting to copy from {src_file} to {dest_file}")
-    async with semaphore:
-        if os.path.isfile(src_file):
-            try:
-                async with aiofiles.open(src_file, 'rb') as src, aiofiles.open(dest_file, 'wb') as dest:
-                    await dest.write(await src.read())
-                os.chmod(dest_file, stat.S_IWRITE)
-                log_success(f"Copied {src_file} to {dest_file}")
-            except Exception as e:
-                log_error(f"Error copying {src_file} to {dest_file}: {e}")
-        else:
-            log_error(f"File not found: {src_file}")
-
-# Copy and sort entity files based on the workbook and entity type
-async def copy_entity_files(worker, workbook, version_path, entity_type):
-    logger.debug(f"Starting copy_entity_files with version_path: {version_path}, entity_type: {entity_type}")
+# Build the copy plan for one entity sheet of the workbook
+def plan_entity_sheet(workbook, version_path, entity_type):
     sheet_name = entity_type
-    version_name = os.path.basename(version_path)
 
     if sheet_name not in workbook.sheetnames:
         log_error(f"Sheet {sheet_name} not found in the workbook.")
-        return
+        return None
 
     ws = workbook[sheet_name]
-    semaphore = asyncio.Semaphore(20)
-    tasks = []
-    total_rows = ws.max_row - 1
-    completed_rows = 0
-
-    async def copy_files():
-        nonlocal completed_rows
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if worker.stopped:
-                break
-            entity_id = row[0]
-            folder_name = row[1]
-            if not folder_name:
-                log_error(f"Missing Folder_Name in row: {row}")
-                continue
+    return plan_entity_copies(ws.iter_rows(min_row=2, values_only=True), version_path, entity_type,
+                              log_error=log_error)
+
+# Copy and sort entity files based on the workbook and entity type
+async def copy_entity_files(worker, workbook, version_path, entity_type, packed=False, from_store=False, delta_only=False,
+                            dedupe=False):
+    logger.debug(f"Starting copy_entity_files with version_path: {version_path}, entity_type: {entity_type}")
+    plan = plan_entity_sheet(workbook, version_path, entity_type)
+    if plan is None:
+        return
+    if delta_only:
+        delta = load_version_delta(version_path, entity_type)
+        if delta is not None:
+            plan = filter_plan_to_delta(plan, delta)
+            logger.info(f"Delta only: {len(plan.folders)} {entity_type} entities reference added or changed files")
+
+    def report_progress(completed, total):
+        worker.progress.emit(int((completed / total) * 100))
+        worker.progress_info.emit(completed, total)
+
+    if packed:
+        # One uncompressed .tar per entity instead of thousands of small folders
+        await run_pack_jobs(plan, pools=DevicePools(), throttle=copy_throttle, log_success=log_success,
+                            log_error=log_error, progress_callback=report_progress, should_stop=lambda: worker.stopped)
+        return
+
+    folder_stats = create_destination_folders(plan, log_error=log_error)
+    logger.info(f"Created {folder_stats.created} {entity_type} folders in one pass, skipped {folder_stats.skipped_empty} "
+                f"empty rows, saved {folder_stats.saved} filesystem metadata operations")
 
-            dest_dir = os.path.join(r"B:\\Kathana-Out\\Sorted", version_name, entity_type, folder_name)
-            ensure_directory_exists(dest_dir)
-            files_copied = False
-
-            # Copy Mesh files
-            for mesh_file in row[2:6]:
-                if mesh_file:
-                    src_file = os.path.join(version_path, "resource", "object", entity_type, "Mesh", mesh_file)
-                    dest_file = os.path.join(dest_dir, mesh_file)
-                    tasks.append(copy_file_async(src_file, dest_file, semaphore))
-                    files_copied = True
-
-            # Copy Animation files
-            for ani_file in row[6:]:
-                if ani_file:
-                    src_file = os.path.join(version_path, "resource", "object", entity_type, "Ani", ani_file)
-                    dest_file = os.path.join(dest_dir, ani_file)
-                    tasks.append(copy_file_async(src_file, dest_file, semaphore))
-                    files_copied = True
-
-            if not files_copied:
-                shutil.rmtree(dest_dir)
-                log_error(f"Removed empty directory: {dest_dir}")
-
-            completed_rows += 1
-            progress = int((completed_rows / total_rows) * 100)
-            worker.progress.emit(progress)
-            worker.progress_info.emit(completed_rows, total_rows)
-
-    await copy_files()
-    await asyncio.gather(*tasks)
+    if from_store:
+        # Sorted views become hard links into the content-addressed store: no data is copied
+        linked, unresolved = await asyncio.to_thread(link_plan_from_store, plan, ObjectStore(), version_path,
+                                                     log_success=log_success, log_error=log_error,
+                                                     progress_callback=report_progress)
+        logger.info(f"Linked {linked} {entity_type} files from the store, {unresolved} not found in the store")
+        return
+
+    links = []
+    if dedupe:
+        canonical = load_version_duplicates(version_path)
+        if canonical is not None:
+            plan, links = dedupe_copy_plan(plan, canonical, version_path)
+            logger.info(f"Copying {len(plan.jobs)} distinct {entity_type} files, linking {len(links)} duplicates")
+
+    # Largest-first on SSDs; archive versions on HDDs are read in on-disk order.
+    # Each source and destination device gets its own concurrency budget.
+    policy = choose_copy_policy(version_path)
+    logger.info(f"Copy policy for {version_path}: {policy}")
+    jobs = order_copy_jobs(plan.jobs, policy)
+    await run_copy_jobs(jobs, pools=DevicePools(), throttle=copy_throttle, log_success=log_success, log_error=log_error,
+                        progress_callback=report_progress, should_stop=lambda: worker.stopped)
+    if links and not worker.stopped:
+        await asyncio.to_thread(link_duplicate_copies, links, log_success, log_error)
 
 # Copy and sort files for a specific entity type
-def copy_and_sort_files(worker, version_path, entity_type):
+def copy_and_sort_files(worker, version_path, entity_type, packed=False, dry_run=False, from_store=False, delta_only=False,
+                        dedupe=False):
+    if dry_run:
+        dry_run_copy_plan(worker, [version_path], [entity_type])
+        return
     logger.debug(f"Initiating copy_and_sort_files for {entity_type} from {version_path}")
     logger.info(f"Copying and sorting {entity_type} files from {version_path}...")
     wb = openpyxl.load_workbook(ENTITY_XLSX_PATH)
     start_time = time.time()
+    copy_throttle.reset()
 
     with ThreadPoolExecutor(max_workers=20) as executor:
-        future = executor.submit(asyncio.run, copy_entity_files(worker, wb, version_path, entity_type))
+        future = executor.submit(asyncio.run, copy_entity_files(worker, wb, version_path, entity_type, packed, from_store,
+                                                                  delta_only, dedupe))
         future.result()
 
     end_time = time.time()
     elapsed_time = end_time - start_time
+    bytes_rate, files_rate = copy_throttle.throughput()
+    record_copy_run(copy_throttle.bytes_copied, copy_throttle.files_copied, elapsed_time)
     logger.info(f"{entity_type} files copied and sorted. Time elapsed: {str(timedelta(seconds=elapsed_time))}")
+    logger.info(f"Effective throughput: {format_rate(bytes_rate)}, {files_rate:.1f} files/s")
 
 # Copy and sort files for all entity types
-def copy_and_sort_all_files(worker, version_path):
-    copy_and_sort_files(worker, version_path, 'PC')
-    copy_and_sort_files(worker, version_path, 'NPC')
-    copy_and_sort_files(worker, version_path, 'Monster')
+def copy_and_sort_all_files(worker, version_path, packed=False, dry_run=False, from_store=False, delta_only=False,
+                            dedupe=False):
+    if dry_run:
+        dry_run_copy_plan(worker, [version_path], ['PC', 'NPC', 'Monster'])
+        return
+    copy_and_sort_files(worker, version_path, 'PC', packed, from_store=from_store, delta_only=delta_only,
+                        dedupe=dedupe)
+    copy_and_sort_files(worker, version_path, 'NPC', packed, from_store=from_store, delta_only=delta_only,
+                        dedupe=dedupe)
+    copy_and_sort_files(worker, version_path, 'Monster', packed, from_store=from_store, delta_only=delta_only,
+                        dedupe=dedupe)
+
+# Copy entity files and convert each entity to FBX as soon as its own files are in Sorted, for one type or 'All'
+def copy_and_convert_files(worker, version_path, entity_type, delta_only=False, noesis_workers=NOESIS_WORKERS,
+                           rebuild=False):
+    logger.info(f"Copying and converting {entity_type} files from {version_path}...")
+    entity_types = ['PC', 'NPC', 'Monster'] if entity_type == 'All' else [entity_type]
+    wb = openpyxl.load_workbook(ENTITY_XLSX_PATH)
+    plans = []
+    for t in entity_types:
+        plan = plan_entity_sheet(wb, version_path, t)
+        if plan is None:
+            continue
+        if delta_only:
+            delta = load_version_delta(version_path, t)
+            if delta is not None:
+                plan = filter_plan_to_delta(plan, delta)
+        create_destination_folders(plan, log_error=log_error)
+        plans.append((t, plan))
+    copy_throttle.reset()
+
+    def report_progress(completed, total):
+        worker.progress.emit(int((completed / total) * 100))
+        worker.progress_info.emit(completed, total)
+
+    # Copies keep their per-device budgets; conversions get their own pool of Noesis processes
+    stats = asyncio.run(run_copy_convert_pipeline(plans, version_path, NOESIS_EXE_PATH, NOESIS_FLAGS, noesis_workers,
+                                                  pools=DevicePools(), throttle=copy_throttle,
+                                                  build_state=FbxBuildState(), rebuild=rebuild,
+                                                  log_success=log_success, log_error=log_error,
+                                                  progress_callback=report_progress,
+                                                  should_stop=lambda: worker.stopped))
+    record_copy_run(copy_throttle.bytes_copied, copy_throttle.files_copied, stats.copies_done_at)
+    for line in format_pipeline_stats(stats):
+        logger.info(line)
+    logger.info(f"{entity_type} files copied and converted. Time elapsed: {str(timedelta(seconds=stats.seconds))}")
+
+# Plan the copies for the given versions and entity types and report them without touching any data
+def dry_run_copy_plan(worker, version_paths, entity_types):
+    start_time = time.time()
+    wb = openpyxl.load_workbook(ENTITY_XLSX_PATH, read_only=True)
+    all_plans = []
+    for version_path in version_paths:
+        plans = [plan for plan in (plan_entity_sheet(wb, version_path, entity_type) for entity_type in entity_types)
+                 if plan is not None]
+        for line in format_plan_estimate(estimate_plans(plans), f"Dry run {os.path.basename(version_path)}"):
+            logger.info(line)
+        all_plans.extend(plans)
+    if len(version_paths) > 1:
+        for line in format_plan_estimate(estimate_plans(all_plans), "Dry run all versions"):
+            logger.info(line)
+    logger.info(f"Dry run finished in {time.time() - start_time:.1f}s")
+
+# Load the added/changed file names of the last diff saved for a version
+def load_version_delta(version_path, entity_type):
+    delta = load_delta(os.path.basename(version_path), entity_type)
+    if delta is None:
+        log_error(f"No diff saved for {version_path}; processing every {entity_type} asset")
+    return delta
+
+# Diff a version against the previous one and save the delta for the copy and FBX steps
+def diff_against_previous_version(worker, version_path):
+    index = KATHANA_VERSIONS.index(version_path)
+    if index == 0:
+        log_error(f"{version_path} has no previous version to diff against")
+        return
+    previous_path = KATHANA_VERSIONS[index - 1]
+    logger.info(f"Comparing {previous_path} with {version_path}...")
+    report = diff_versions(previous_path, version_path)
+    save_diff(previous_path, version_path, report)
+    for line in format_diff(report):
+        logger.info(line)
+
+# Load the duplicate map of the last scan of a version: {asset key: canonical asset key},
+# or {file name: canonical asset key} for one entity type
+def load_version_duplicates(version_path, entity_type=None):
+    canonical = load_duplicates(os.path.basename(version_path))
+    if canonical is None:
+        log_error(f"No duplicate scan saved for {version_path}; processing every file")
+        return None
+    return duplicate_names(canonical, entity_type) if entity_type else canonical
+
+# Scan a version for byte-identical Mesh and Ani files and save the groups for the copy and FBX steps
+def find_version_duplicates(worker, version_path):
+    logger.info(f"Scanning {version_path} for duplicate assets...")
+    start_time = time.time()
+    groups, stats = find_duplicates(version_path)
+    save_duplicates(version_path, groups)
+    for line in format_duplicates(groups, stats):
+        logger.info(line)
+    logger.info(f"Time elapsed: {str(timedelta(seconds=time.time() - start_time))}")
+
+# Return the FBX already planned for the same mesh and animation content, remembering new pairs
+def converted_duplicate(converted, duplicates, tmb_file, tab_file, output_file):
+    pair = (duplicates.get(tmb_file.lower(), tmb_file.lower()), duplicates.get(tab_file.lower(), tab_file.lower()))
+    if pair in converted:
+        return converted[pair]
+    converted[pair] = output_file
+    return None
+
+# Ingest a version's Mesh and Ani files into the content-addressed store
+def ingest_version_into_store(worker, version_path):
+    logger.info(f"Ingesting {version_path} into the asset store...")
+    start_time = time.time()
+
+    def report_progress(completed, total):
+        worker.progress.emit(int((completed / total) * 100))
+        worker.progress_info.emit(completed, total)
+
+    stats = ObjectStore().ingest_version(version_path, progress_callback=report_progress)
+    logger.info(f"Ingested {stats.files} files: {stats.new_objects} new objects ({stats.bytes_added / 1024 ** 2:.1f} MB), "
+                f"{stats.bytes_shared / 1024 ** 2:.1f} MB already stored, {stats.cache_hits} of {stats.files} digests "
+                f"from cache. Time elapsed: {str(timedelta(seconds=time.time() - start_time))}")
 
-# Generate FBX files for a specific entity type
-def generate_fbx_files(worker, version_path, entity_type, generate_batch_only=False, combined_batch=False, batch_commands=[]):
+# Dry run the copy of every entity type for every Kathana version
+def dry_run_all_versions(worker):
+    dry_run_copy_plan(worker, KATHANA_VERSIONS, ['PC', 'NPC', 'Monster'])
+
+# Generate FBX files for a specific entity type, or for every type at once with 'All'
+def generate_fbx_files(worker, version_path, entity_type, generate_batch_only=False, delta_only=False, dedupe=False,
+                       from_source=False, noesis_workers=NOESIS_WORKERS, rebuild=False, use_cache=False,
+                       batch_shards=1, anims_per_job=NOESIS_ANIMS_PER_JOB, match_skeletons=False):
     logger.debug(f"Generating FBX files for {entity_type} from {version_path}")
     logger.info(f"Generating {entity_type} FBX files from {version_path}...")
-
-    root_dir = os.path.join(r"B:\\Kathana-Out\\Sorted", os.path.basename(version_path), entity_type)
-    fbx_base_dir = os.path.join(r"B:\\Kathana-Out\\FBX", os.path.basename(version_path), entity_type)
-    ensure_directory_exists(fbx_base_dir)
-
-    if combined_batch:
-        for root, dirs, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith(".tmb"):
-                    tmb_path = os.path.join(root, file)
-                    tab_files = [f for f in files if f.endswith(".tab")]
-                    for tab_file in tab_files:
-                        tab_path = os.path.join(root, tab_file)
-                        output_file = os.path.join(fbx_base_dir, os.path.relpath(tab_path, root_dir)).replace(".tab", ".fbx")
-                        ensure_directory_exists(os.path.dirname(output_file))
-                        command = f'"{NOESIS_EXE_PATH}" ?cmode "{tmb_path}" "{output_file}" -loadanimsingle "{tab_path}" -fbxnoextraframe'
-                        batch_commands.append(command)
+    entity_types = ['PC', 'NPC', 'Monster'] if entity_type == 'All' else [entity_type]
+    anims_per_job = effective_anims_per_job(anims_per_job, NOESIS_EXE_PATH)
+    deltas = {t: load_version_delta(version_path, t) for t in entity_types} if delta_only else {}
+    # Duplicate pairs are copied per animation FBX, which multi-animation exports do not produce
+    duplicates = {t: load_version_duplicates(version_path, t) for t in entity_types} \
+        if dedupe and anims_per_job <= 1 else {}
+    # Pairs with the same mesh and animation content are converted once and the FBX copied afterwards
+    converted = {t: {} for t in entity_types}
+    duplicate_copies = []
+
+    if from_source:
+        # Noesis reads resource/object/<type>/Mesh and Ani in place; nothing has to be copied to Sorted first
+        wb = openpyxl.load_workbook(ENTITY_XLSX_PATH, read_only=True)
+        jobs = []
+        for t in entity_types:
+            plan = plan_entity_sheet(wb, version_path, t)
+            if plan:
+                jobs.extend(plan_fbx_from_copy_plan(plan, version_path, t, log_error=log_error))
     else:
-        batch_file_path = os.path.join(root_dir, f"generate_{entity_type.lower()}_fbx.bat")
-        ensure_directory_exists(os.path.dirname(batch_file_path))
-
-        with open(batch_file_path, 'w') as batch_file:
-            for root, dirs, files in os.walk(root_dir):
-                for file in files:
-                    if file.endswith(".tmb"):
-                        tmb_path = os.path.join(root, file)
-                        tab_files = [f for f in files if f.endswith(".tab")]
-                        for tab_file in tab_files:
-                            tab_path = os.path.join(root, tab_file)
-                            output_file = os.path.join(fbx_base_dir, os.path.relpath(tab_path, root_dir)).replace(".tab", ".fbx")
-                            ensure_directory_exists(os.path.dirname(output_file))
-                            command = f'"{NOESIS_EXE_PATH}" ?cmode "{tmb_path}" "{output_file}" -loadanimsingle "{tab_path}" -fbxnoextraframe'
-                            batch_file.write(command + '\n')
-
-        logger.info(f"Batch script for generating {entity_type} FBX files created at {batch_file_path}")
-        if not generate_batch_only:
-            os.system(f'cmd /c "{batch_file_path}"')
-            logger.info(f"{entity_type} FBX files generation complete.")
+        # One scandir per Sorted folder for all entity types
+        jobs = plan_fbx_version(version_path, entity_types)
+
+    if match_skeletons:
+        # Skip pairs KATHANA_SKELETONS.json marks as mismatched and pairs Noesis already rejected with the same
+        # inputs; a forced rebuild retries the rejected ones
+        jobs, skipped = filter_compatible_pairs(jobs, SkeletonIndex.load(), retry_failed=rebuild)
+        save_skipped_pairs(version_path, skipped)
+        for line in format_skipped_pairs(skipped):
+            logger.info(line)
+
+    planned = []
+    for job in jobs:
+        tmb_file = os.path.basename(job.tmb)
+        tab_file = os.path.basename(job.tab)
+        delta = deltas.get(job.entity_type)
+        if delta is not None and tmb_file.lower() not in delta and tab_file.lower() not in delta:
+            continue
+        if duplicates.get(job.entity_type) is not None:
+            first_output = converted_duplicate(converted[job.entity_type], duplicates[job.entity_type], tmb_file,
+                                               tab_file, job.output)
+            if first_output is not None:
+                if first_output != job.output:
+                    duplicate_copies.append((first_output, job.output))
+                continue
+        planned.append(job)
+    if anims_per_job > 1:
+        # One Noesis launch loads the mesh once for up to anims_per_job animations
+        pairs = len(planned)
+        planned = group_animations(planned, anims_per_job)
+        logger.info(f"{pairs} {entity_type} mesh/animation pairs grouped into {len(planned)} Noesis runs")
+    folders = create_output_folders([job.output for job in planned] + [dest for src, dest in duplicate_copies])
+    logger.info(f"Planned {len(planned)} {entity_type} conversions in {folders} output folders")
+
+    # Make-style: skip pairs whose FBX is newer than both inputs and was built with the same flags
+    build_state = FbxBuildState()
+    current = []
+    if not rebuild:
+        planned, current = split_outdated(planned, build_state)
+        logger.info(f"{len(current)} {entity_type} FBX files are up to date, {len(planned)} to convert")
+    build_state.mark_queued(planned, NOESIS_FLAGS)
+    build_state.save()
+
+    # Pairs already converted for another version are linked from the FBX cache instead of launching Noesis
+    fbx_cache = FbxCache() if use_cache else None
+    cache_keys = {}
+    if fbx_cache:
+        with DigestCache() as digest_cache:
+            cache_keys = fbx_cache.keys(planned + current, digest_cache, NOESIS_FLAGS)
+        planned = fbx_cache.fetch(planned, cache_keys)
+        # Outputs built by an earlier .bat run join the cache too
+        fbx_cache.store(current, cache_keys)
+        logger.info(format_fbx_cache_stats(fbx_cache))
+
+    # Outputs linked from the FBX cache by an earlier run must not be written through, by Noesis or by the scripts
+    for output in [job.output for job in planned] + [dest for src, dest in duplicate_copies]:
+        if os.path.lexists(output):
+            os.remove(output)
+
+    # The structured job list is what runs; the .bat and .sh files are exported from it
+    specs = plan_job_specs(planned, duplicate_copies, NOESIS_EXE_PATH, NOESIS_FLAGS)
+    if duplicate_copies:
+        logger.info(f"{len(duplicate_copies)} duplicate {entity_type} conversions replaced by copies")
+
+    sorted_dir = os.path.join(r"B:\\Kathana-Out\\Sorted", os.path.basename(version_path))
+    if entity_type == 'All':
+        batch_file_path = os.path.join(sorted_dir, "generate_all_fbx.bat")
+    else:
+        batch_file_path = os.path.join(sorted_dir, entity_type, f"generate_{entity_type.lower()}_fbx.bat")
+    ensure_directory_exists(os.path.dirname(batch_file_path))
+
+    spec_path = os.path.splitext(batch_file_path)[0] + ".jsonl"
+    save_job_specs(specs, spec_path)
+    export_job_specs(specs, batch_file_path)
+    export_job_specs(specs, os.path.splitext(batch_file_path)[0] + ".sh")
+
+    logger.info(f"Job list for generating {entity_type} FBX files written to {spec_path}, "
+                f"batch script created at {batch_file_path}")
+    if batch_shards > 1:
+        # Cost-balanced, resumable .bat/.sh shards for running on several machines or terminals
+        written = write_shards(specs, batch_shards, os.path.dirname(batch_file_path),
+                               os.path.splitext(os.path.basename(batch_file_path))[0])
+        for line in format_shards(written):
+            logger.info(line)
+    if not generate_batch_only:
+        run_fbx_jobs(worker, planned, duplicate_copies, noesis_workers, build_state, fbx_cache, cache_keys,
+                     {spec['outputs'][0]: spec['argv'] for spec in specs if spec['kind'] == 'noesis'})
+        logger.info(f"{entity_type} FBX files generation complete.")
+
+# Convert the planned jobs on a pool of Noesis processes, then fill in the FBX of duplicate pairs
+def run_fbx_jobs(worker, jobs, duplicate_copies=(), noesis_workers=NOESIS_WORKERS, build_state=None, fbx_cache=None,
+                 cache_keys=None, argvs=None):
+    start_time = time.time()
+    # The progress bar advances by predicted conversion time, learned from earlier -showstats runs
+    model = fit_cost_model(load_metrics())
+    costs = {job.output: estimate_job_seconds(job, model) for job in jobs}
+    total_cost = sum(costs.values()) or 1
+    done_cost = 0.0
+    if model:
+        logger.info(f"Predicted conversion time: {timedelta(seconds=int(predict_run_seconds(costs.values(), noesis_workers)))}")
+
+    def report_progress(completed, total, result):
+        nonlocal done_cost
+        if result is not None:
+            done_cost += costs.get(result.job.output, 0.0)
+        worker.progress.emit(int((done_cost / total_cost) * 100))
+        worker.progress_info.emit(completed, total)
+
+    results = run_noesis_jobs(jobs, NOESIS_EXE_PATH, workers=noesis_workers, log_success=log_success,
+                              log_error=log_error, progress_callback=report_progress,
+                              should_stop=lambda: worker.stopped, argvs=argvs, build_state=build_state)
+    converted = {result.job.output for result in results if result.ok}
+    if build_state:
+        build_state.forget(result.job for result in results if not result.ok)
+        build_state.save()
+    if fbx_cache:
+        fbx_cache.store([result.job for result in results if result.ok], cache_keys)
+        logger.info(format_fbx_cache_stats(fbx_cache))
+    for src, dest in duplicate_copies:
+        if src in converted or (os.path.exists(src) and not os.path.exists(dest)):
+            # Replace rather than overwrite, in case dest is a hard link into the FBX cache
+            if os.path.lexists(dest):
+                os.remove(dest)
+            shutil.copyfile(src, dest)
+    logger.info(format_run_summary(results, time.time() - start_time))
+    for line in format_failure_report(failure_report(results)):
+        log_error(line)
 
 # Generate a combined FBX batch file for all entity types
-def generate_combined_fbx_batch_file(worker, version_path):
+def generate_combined_fbx_batch_file(worker, version_path, delta_only=False, dedupe=False, from_source=False,
+                                     rebuild=False, use_cache=False, batch_shards=1,
+                                     anims_per_job=NOESIS_ANIMS_PER_JOB, match_skeletons=False):
     logger.debug(f"Generating combined FBX batch file for {version_path}")
-    batch_commands = []
-    generate_fbx_files(worker, version_path, 'PC', generate_batch_only=True, combined_batch=True, batch_commands=batch_commands)
-    generate_fbx_files(worker, version_path, 'NPC', generate_batch_only=True, combined_batch=True, batch_commands=batch_commands)
-    generate_fbx_files(worker, version_path, 'Monster', generate_batch_only=True, combined_batch=True, batch_commands=batch_commands)
-
-    combined_batch_file_path = os.path.join(r"B:\\Kathana-Out\\Sorted", os.path.basename(version_path), "generate_all_fbx.bat")
-    with open(combined_batch_file_path, 'w') as batch_file:
-        for command in batch_commands:
-            batch_file.write(command + '\n')
-
-    logger.info(f"Combined batch script for generating all entity FBX files created at {combined_batch_file_path}")
+    generate_fbx_files(worker, version_path, 'All', generate_batch_only=True, delta_only=delta_only, dedupe=dedupe,
+                       from_source=from_source, rebuild=rebuild, use_cache=use_cache, batch_shards=batch_shards,
+                       anims_per_job=anims_per_job, match_skeletons=match_skeletons)
 
 # Clean specific files for a given version and entity type
 def clean_specific_files(worker, version, entity_type):
@@ -443,6 +685,18 @@ class KathanaVersionTool(QWidget):
         set_version_btn.clicked.connect(self.set_version)
         button_layout.addWidget(set_version_btn)
 
+        ingest_btn = SoundButton('Ingest Into Store', hover_sound, click_sound, self)
+        ingest_btn.clicked.connect(self.run_ingest_task)
+        button_layout.addWidget(ingest_btn)
+
+        diff_btn = SoundButton('Diff vs Previous Version', hover_sound, click_sound, self)
+        diff_btn.clicked.connect(self.run_diff_task)
+        button_layout.addWidget(diff_btn)
+
+        dupes_btn = SoundButton('Find Duplicates', hover_sound, click_sound, self)
+        dupes_btn.clicked.connect(self.run_duplicates_task)
+        button_layout.addWidget(dupes_btn)
+
         layout.addLayout(button_layout)
 
         buttons_layout = QHBoxLayout()
@@ -479,10 +733,78 @@ class KathanaVersionTool(QWidget):
         control_buttons_layout = QHBoxLayout()
         self.add_button_row(
             control_buttons_layout,
-            [('Clean Up', self.clean_up), ('Stop', self.stop_processes), ('Refresh', self.restart_application)]
+            [('Dry Run', lambda: self.run_task('All', dry_run=True)), ('Dry Run All Versions', self.run_dry_run_all),
+             ('Clean Up', self.clean_up), ('Stop', self.stop_processes), ('Refresh', self.restart_application)]
         )
         layout.addLayout(control_buttons_layout)
 
+        # Copy limits and live throughput
+        throttle_layout = QHBoxLayout()
+        throttle_layout.addWidget(QLabel('Copy limit:'))
+        self.bandwidth_limit_spin = QSpinBox()
+        self.bandwidth_limit_spin.setRange(0, 10000)
+        self.bandwidth_limit_spin.setSuffix(' MB/s')
+        self.bandwidth_limit_spin.setSpecialValueText('Unlimited MB/s')
+        self.bandwidth_limit_spin.valueChanged.connect(self.update_copy_limits)
+        throttle_layout.addWidget(self.bandwidth_limit_spin)
+        self.iops_limit_spin = QSpinBox()
+        self.iops_limit_spin.setRange(0, 10000)
+        self.iops_limit_spin.setSuffix(' files/s')
+        self.iops_limit_spin.setSpecialValueText('Unlimited files/s')
+        self.iops_limit_spin.valueChanged.connect(self.update_copy_limits)
+        throttle_layout.addWidget(self.iops_limit_spin)
+        throttle_layout.addSpacerItem(QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
+        self.throughput_label = QLabel('Throughput: -')
+        throttle_layout.addWidget(self.throughput_label)
+        layout.addLayout(throttle_layout)
+
+        # Copy options
+        copy_options_layout = QHBoxLayout()
+        self.packed_output_check = QCheckBox('Packed output (.tar per entity)')
+        copy_options_layout.addWidget(self.packed_output_check)
+        self.link_from_store_check = QCheckBox('Link from store')
+        copy_options_layout.addWidget(self.link_from_store_check)
+        self.delta_only_check = QCheckBox('Only changed assets')
+        copy_options_layout.addWidget(self.delta_only_check)
+        self.dedupe_check = QCheckBox('Process duplicates once')
+        copy_options_layout.addWidget(self.dedupe_check)
+        self.convert_while_copying_check = QCheckBox('Convert while copying')
+        copy_options_layout.addWidget(self.convert_while_copying_check)
+        copy_options_layout.addStretch()
+        layout.addLayout(copy_options_layout)
+
+        # FBX options
+        fbx_options_layout = QHBoxLayout()
+        self.fbx_from_source_check = QCheckBox('FBX from source (no Sorted copy)')
+        fbx_options_layout.addWidget(self.fbx_from_source_check)
+        self.force_rebuild_check = QCheckBox('Force FBX rebuild')
+        fbx_options_layout.addWidget(self.force_rebuild_check)
+        self.fbx_cache_check = QCheckBox('Reuse FBX across versions')
+        fbx_options_layout.addWidget(self.fbx_cache_check)
+        self.match_skeletons_check = QCheckBox('Skip failed or mismatched pairs')
+        fbx_options_layout.addWidget(self.match_skeletons_check)
+        fbx_options_layout.addStretch()
+        layout.addLayout(fbx_options_layout)
+
+        # Noesis process counts
+        noesis_layout = QHBoxLayout()
+        self.noesis_workers_spin = QSpinBox()
+        self.noesis_workers_spin.setRange(1, 256)
+        self.noesis_workers_spin.setValue(NOESIS_WORKERS)
+        self.noesis_workers_spin.setSuffix(' Noesis processes')
+        noesis_layout.addWidget(self.noesis_workers_spin)
+        self.anims_per_job_spin = QSpinBox()
+        self.anims_per_job_spin.setRange(1, 100)
+        self.anims_per_job_spin.setValue(NOESIS_ANIMS_PER_JOB)
+        self.anims_per_job_spin.setPrefix('Animations per Noesis run: ')
+        noesis_layout.addWidget(self.anims_per_job_spin)
+        self.batch_shards_spin = QSpinBox()
+        self.batch_shards_spin.setRange(1, 64)
+        self.batch_shards_spin.setPrefix('Batch shards: ')
+        noesis_layout.addWidget(self.batch_shards_spin)
+        noesis_layout.addStretch()
+        layout.addLayout(noesis_layout)
+
         console_section_layout = QVBoxLayout()
 
         console_label = QLabel('Console')
@@ -562,6 +884,7 @@ class KathanaVersionTool(QWidget):
         self.process.finished.connect(self.on_task_finished)
 
         self.timer = QTimer()
+        self.timer.timeout.connect(self.update_throughput_label)
         self.timer.timeout.connect(self.update_progress_labels)
 
     def add_button_row(self, parent_layout, buttons):
@@ -641,16 +964,26 @@ class KathanaVersionTool(QWidget):
         self.version_set = True
         self.append_output(f'Selected version set to: {KATHANA_DISPLAY_NAMES[self.selected_index]}')
 
-    def run_task(self, entity_type):
+    def run_task(self, entity_type, dry_run=False):
         """Run a task to copy and sort files for the specified entity type."""
         if self.selected_version:
             self.start_processing_sound()
             self.progress_bar.setValue(0)
             self.disable_buttons()
-            if entity_type == 'All':
-                self.worker = Worker(copy_and_sort_all_files, self.selected_version)
+            if self.convert_while_copying_check.isChecked() and not dry_run:
+                self.log_ignored_pipeline_options()
+                self.worker = Worker(copy_and_convert_files, self.selected_version, entity_type,
+                                     delta_only=self.delta_only_check.isChecked(),
+                                     noesis_workers=self.noesis_workers_spin.value(),
+                                     rebuild=self.force_rebuild_check.isChecked())
+            elif entity_type == 'All':
+                self.worker = Worker(copy_and_sort_all_files, self.selected_version, self.packed_output_check.isChecked(),
+                                     dry_run, self.link_from_store_check.isChecked(), self.delta_only_check.isChecked(),
+                                     self.dedupe_check.isChecked())
             else:
-                self.worker = Worker(copy_and_sort_files, self.selected_version, entity_type)
+                self.worker = Worker(copy_and_sort_files, self.selected_version, entity_type,
+                                     self.packed_output_check.isChecked(), dry_run, self.link_from_store_check.isChecked(),
+                                     self.delta_only_check.isChecked(), self.dedupe_check.isChecked())
             self.worker.output.connect(self.append_output)
             self.worker.error.connect(self.append_error)
             self.worker.finished.connect(self.on_task_finished)
@@ -661,13 +994,86 @@ class KathanaVersionTool(QWidget):
         else:
             self.append_error('Error: Please choose a Kathana version first.')
 
+    def log_ignored_pipeline_options(self):
+        """Say which of the checked options a copy-and-convert run does not use."""
+        ignored = [check.text() for check in (self.packed_output_check, self.link_from_store_check, self.dedupe_check,
+                                              self.fbx_cache_check, self.match_skeletons_check) if check.isChecked()]
+        if self.anims_per_job_spin.value() > 1:
+            ignored.append(f"{self.anims_per_job_spin.prefix()}{self.anims_per_job_spin.value()}")
+        if ignored:
+            self.append_output(f"Convert while copying ignores: {', '.join(ignored)}")
+
+    def run_ingest_task(self):
+        """Run a task to ingest the selected version into the asset store."""
+        if self.selected_version:
+            self.start_processing_sound()
+            self.progress_bar.setValue(0)
+            self.disable_buttons()
+            self.worker = Worker(ingest_version_into_store, self.selected_version)
+            self.worker.output.connect(self.append_output)
+            self.worker.error.connect(self.append_error)
+            self.worker.finished.connect(self.on_task_finished)
+            self.worker.progress.connect(self.update_progress)
+            self.worker.progress_info.connect(self.update_progress_info)
+            self.worker.start()
+            self.timer.start(100)
+        else:
+            self.append_error('Error: Please choose a Kathana version first.')
+
+    def run_diff_task(self):
+        """Run a task to diff the selected version against the previous one."""
+        if self.selected_version:
+            self.start_processing_sound()
+            self.progress_bar.setValue(0)
+            self.disable_buttons()
+            self.worker = Worker(diff_against_previous_version, self.selected_version)
+            self.worker.output.connect(self.append_output)
+            self.worker.error.connect(self.append_error)
+            self.worker.finished.connect(self.on_task_finished)
+            self.worker.start()
+        else:
+            self.append_error('Error: Please choose a Kathana version first.')
+
+    def run_duplicates_task(self):
+        """Run a task to find duplicate assets in the selected version."""
+        if self.selected_version:
+            self.start_processing_sound()
+            self.progress_bar.setValue(0)
+            self.disable_buttons()
+            self.worker = Worker(find_version_duplicates, self.selected_version)
+            self.worker.output.connect(self.append_output)
+            self.worker.error.connect(self.append_error)
+            self.worker.finished.connect(self.on_task_finished)
+            self.worker.start()
+        else:
+            self.append_error('Error: Please choose a Kathana version first.')
+
+    def run_dry_run_all(self):
+        """Run a dry-run copy plan for every Kathana version."""
+        self.start_processing_sound()
+        self.progress_bar.setValue(0)
+        self.disable_buttons()
+        self.worker = Worker(dry_run_all_versions)
+        self.worker.output.connect(self.append_output)
+        self.worker.error.connect(self.append_error)
+        self.worker.finished.connect(self.on_task_finished)
+        self.worker.start()
+
     def run_fbx_task(self, entity_type, generate_batch_only=False):
         """Run a task to generate FBX files for the specified entity type."""
         if self.selected_version:
             self.start_processing_sound()
             self.progress_bar.setValue(0)
             self.disable_buttons()
-            self.worker = Worker(generate_fbx_files, self.selected_version, entity_type, generate_batch_only)
+            self.worker = Worker(generate_fbx_files, self.selected_version, entity_type, generate_batch_only,
+                                 delta_only=self.delta_only_check.isChecked(), dedupe=self.dedupe_check.isChecked(),
+                                 from_source=self.fbx_from_source_check.isChecked(),
+                                 noesis_workers=self.noesis_workers_spin.value(),
+                                 rebuild=self.force_rebuild_check.isChecked(),
+                                 use_cache=self.fbx_cache_check.isChecked(),
+                                 batch_shards=self.batch_shards_spin.value(),
+                                 anims_per_job=self.anims_per_job_spin.value(),
+                                 match_skeletons=self.match_skeletons_check.isChecked())
             self.worker.output.connect(self.append_output)
             self.worker.error.connect(self.append_error)
             self.worker.finished.connect(self.on_task_finished)
@@ -684,7 +1090,14 @@ class KathanaVersionTool(QWidget):
             self.start_processing_sound()
             self.progress_bar.setValue(0)
             self.disable_buttons()
-            self.worker = Worker(generate_combined_fbx_batch_file, self.selected_version)
+            self.worker = Worker(generate_combined_fbx_batch_file, self.selected_version,
+                                 delta_only=self.delta_only_check.isChecked(), dedupe=self.dedupe_check.isChecked(),
+                                 from_source=self.fbx_from_source_check.isChecked(),
+                                 rebuild=self.force_rebuild_check.isChecked(),
+                                 use_cache=self.fbx_cache_check.isChecked(),
+                                 batch_shards=self.batch_shards_spin.value(),
+                                 anims_per_job=self.anims_per_job_spin.value(),
+                                 match_skeletons=self.match_skeletons_check.isChecked())
             self.worker.output.connect(self.append_output)
             self.worker.error.connect(self.append_error)
             self.worker.finished.connect(self.on_task_finished)
@@ -787,12 +1200,32 @@ class KathanaVersionTool(QWidget):
         self.progress_label_left.setText(f'{processed} / {total}')
         self.progress_label_right.setText(f'{self.progress_bar.value()}%')
 
+    def update_copy_limits(self):
+        """Apply the copy bandwidth and file-rate limits; takes effect on the running job."""
+        copy_throttle.set_limits(self.bandwidth_limit_spin.value() * 1024 * 1024, self.iops_limit_spin.value())
+
+    def update_throughput_label(self):
+        """Show the effective copy throughput."""
+        bytes_rate, files_rate = copy_throttle.throughput()
+        self.throughput_label.setText(f'Throughput: {format_rate(bytes_rate)}, {files_rate:.1f} files/s')
+
     def update_progress_labels(self):
         """Update the progress labels and bar every 100ms."""
         if self.worker:
             self.update_progress_info(self.worker.progress_info_value[0], self.worker.progress_info_value[1])
 
 if __name__ == '__main__':
+    # Lets the digest process pool start its workers from a PyInstaller build
+    multiprocessing.freeze_support()
+
+    # Initialize pygame for sound
+    pygame.mixer.init()
+
+    ensure_directory_exists(os.path.dirname(LOG_XLSX_PATH))
+    wb_log = initialize_log_workbook()
+    error_log_ws = wb_log['ERROR_LOGS']
+    success_log_ws = wb_log['SUCCESS_LOGS']
+
     app = QApplication(sys.argv)
     # Apply PyDracula theme
     app.setStyle("Fusion")
@@ -0,0 +1,528 @@
+import os
+import sys
+import time
+import math
+import asyncio
+import heapq
+import random
+import shutil
+import argparse
+import tempfile
+import logging
+import ctypes
+import mmap
+
+import kathana_copy
+import kathana_fbx
+import kathana_noesis
+import kathana_pipeline
+from kathana_copy import plan_entity_copies, order_copy_jobs, create_destination_folders, run_copy_jobs, \
+    COPY_CHUNK_SIZE
+
+logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+
+def build_skewed_tree(root, entities=400, huge_entities=30, seed=7):
+    """Create a sparse synthetic version tree and its workbook rows.
+
+    Most entities get a ~100 KB mesh and a few small animations; the last
+    `huge_entities` rows get PC-style .tmb files of 80-320 MB, the
+    worst case for row-order scheduling.
+    """
+    rng = random.Random(seed)
+    mesh_dir = os.path.join(root, "resource", "object", "PC", "Mesh")
+    ani_dir = os.path.join(root, "resource", "object", "PC", "Ani")
+    os.makedirs(mesh_dir, exist_ok=True)
+    os.makedirs(ani_dir, exist_ok=True)
+
+    def make(path, size):
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+    rows = []
+    for i in range(entities):
+        huge = i >= entities - huge_entities
+        mesh = f"m{i:05d}.tmb"
+        make(os.path.join(mesh_dir, mesh), rng.randint(80, 320) * 1024 * 1024 if huge else rng.randint(40, 160) * 1024)
+        anis = []
+        for a in range(rng.randint(2, 8)):
+            ani = f"a{i:05d}_{a:02d}.tab"
+            make(os.path.join(ani_dir, ani), rng.randint(8, 64) * 1024)
+            anis.append(ani)
+        rows.append((i, f"E{i:05d}", mesh, None, None, None, *anis))
+    return rows
+
+
+def simulate_makespan(jobs, slots, bandwidth, latency):
+    """Simulate `slots` copy slots taking jobs in list order; return the time each slot runs out of work, sorted."""
+    free_at = [0.0] * slots
+    for job in jobs:
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + latency + (job.size or 0) / bandwidth)
+    return sorted(free_at)
+
+
+def bench_schedule(args):
+    """Compare row-order and largest-first scheduling on a skewed synthetic tree.
+
+    The tail latency of a copy job is its makespan, when the last file lands;
+    "straggler tail" is how long the job keeps running after the first slot
+    has run out of work. Per-file completion percentiles are not reported:
+    largest-first finishes the small files later by design, and nothing waits
+    on a single file of the job.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        version_path = os.path.join(tmp, "KathanaBench")
+        rows = build_skewed_tree(version_path, entities=args.entities, huge_entities=args.huge)
+        plan = plan_entity_copies(rows, version_path, 'PC', sorted_root=os.path.join(tmp, "Sorted"))
+
+    bandwidth = args.bandwidth * 1024 * 1024
+    print(f"{len(plan.jobs)} files, {sum(j.size for j in plan.jobs) / 1024 ** 3:.2f} GB, "
+          f"{args.slots} slots at {args.bandwidth} MB/s each")
+    print(f"{'policy':<15}{'makespan s':>12}{'straggler tail s':>18}{'idle slot-s':>13}")
+    for policy in ('row', 'largest_first'):
+        slot_ends = simulate_makespan(order_copy_jobs(plan.jobs, policy), args.slots, bandwidth, args.latency)
+        makespan = slot_ends[-1]
+        busy = sum((j.size or 0) / bandwidth + args.latency for j in plan.jobs)
+        idle = makespan * args.slots - busy
+        print(f"{policy:<15}{makespan:>12.2f}{makespan - slot_ends[0]:>18.2f}{idle:>13.1f}")
+
+
+def build_archive_tree(root, entities=600, seed=11):
+    """Create a sparse version tree whose files were written in name order, as an extracted archive would be.
+
+    The workbook rows reference the files in a shuffled order, like the real
+    Entity sheets whose row order has nothing to do with on-disk layout.
+    """
+    rng = random.Random(seed)
+    mesh_dir = os.path.join(root, "resource", "object", "Monster", "Mesh")
+    ani_dir = os.path.join(root, "resource", "object", "Monster", "Ani")
+    os.makedirs(mesh_dir, exist_ok=True)
+    os.makedirs(ani_dir, exist_ok=True)
+
+    entries = []
+    for i in range(entities):
+        anis = [f"a{i:05d}_{a:02d}.tab" for a in range(rng.randint(4, 12))]
+        entries.append((f"m{i:05d}.tmb", anis))
+    for mesh, anis in entries:
+        with open(os.path.join(mesh_dir, mesh), 'wb') as f:
+            f.truncate(rng.randint(200, 2400) * 1024)
+    for mesh, anis in entries:
+        for ani in anis:
+            with open(os.path.join(ani_dir, ani), 'wb') as f:
+                f.truncate(rng.randint(16, 256) * 1024)
+
+    rng.shuffle(entries)
+    return [(i, f"E{i:05d}", mesh, None, None, None, *anis) for i, (mesh, anis) in enumerate(entries)]
+
+
+def simulate_hdd(jobs, streams, bandwidth, track_seek, full_seek):
+    """Simulate one disk head serving `streams` concurrent chunked readers round-robin.
+
+    Files are laid out back to back in (folder, inode) order. Every chunk that
+    does not continue where the head stopped pays a seek that grows with the
+    square root of the distance, the usual shape of an HDD seek curve.
+    Returns (seconds, seeks).
+    """
+    layout = sorted(jobs, key=lambda job: (os.path.dirname(job.src), job.inode, job.position))
+    offsets = {}
+    span = 0
+    for job in layout:
+        offsets[id(job)] = span
+        span += job.size or 0
+
+    pending = iter(jobs)
+    active = []
+    head = 0
+    elapsed = 0.0
+    seeks = 0
+    while True:
+        while len(active) < streams:
+            job = next(pending, None)
+            if job is None:
+                break
+            active.append([offsets[id(job)], job.size or 0])
+        if not active:
+            break
+        for stream in list(active):
+            position, remaining = stream
+            if position != head:
+                seeks += 1
+                elapsed += track_seek + (full_seek - track_seek) * math.sqrt(abs(position - head) / max(span, 1))
+            chunk = min(COPY_CHUNK_SIZE, remaining)
+            elapsed += chunk / bandwidth
+            head = position + chunk
+            stream[0] += chunk
+            stream[1] -= chunk
+            if stream[1] <= 0:
+                active.remove(stream)
+    return elapsed, seeks
+
+
+def bench_seek(args):
+    """Compare row-order scheduling against locality ordering on a simulated HDD."""
+    with tempfile.TemporaryDirectory() as tmp:
+        version_path = os.path.join(tmp, "Kathana2")
+        rows = build_archive_tree(version_path, entities=args.entities)
+        plan = plan_entity_copies(rows, version_path, 'Monster', sorted_root=os.path.join(tmp, "Sorted"))
+
+    total = sum(j.size for j in plan.jobs)
+    bandwidth = args.bandwidth * 1024 * 1024
+    print(f"{len(plan.jobs)} files, {total / 1024 ** 2:.0f} MB, {args.bandwidth} MB/s sequential, "
+          f"{args.track_seek * 1000:.1f}-{args.full_seek * 1000:.0f} ms seeks")
+    print(f"{'policy':<12}{'readers':>8}{'seconds':>10}{'MB/s':>8}{'seeks':>9}")
+    for policy, streams in (('row', 50), ('row', 2), ('locality', 2), ('locality', 1)):
+        elapsed, seeks = simulate_hdd(order_copy_jobs(plan.jobs, policy), streams, bandwidth,
+                                      args.track_seek, args.full_seek)
+        print(f"{policy:<12}{streams:>8}{elapsed:>10.1f}{total / 1024 ** 2 / elapsed:>8.1f}{seeks:>9}")
+
+
+def meminfo_cached():
+    """Return the page cache size in bytes from /proc/meminfo, or None off Linux."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('Cached:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+def resident_fraction(paths):
+    """Return the fraction of the files' pages that are in the page cache, using mincore()."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        mincore = libc.mincore
+    except (OSError, AttributeError):
+        return None
+    page = mmap.PAGESIZE
+    resident = total = 0
+    for path in paths:
+        size = os.path.getsize(path)
+        if not size:
+            continue
+        pages = (size + page - 1) // page
+        vec = (ctypes.c_ubyte * pages)()
+        with open(path, 'rb') as f:
+            # A private mapping is writable for ctypes but untouched pages still report the file's cache state
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+            anchor = ctypes.c_char.from_buffer(mm)
+            failed = mincore(ctypes.c_void_p(ctypes.addressof(anchor)), ctypes.c_size_t(size), vec)
+            del anchor
+            mm.close()
+        if failed:
+            return None
+        resident += sum(v & 1 for v in vec)
+        total += pages
+    return resident / total if total else None
+
+
+def write_tree(root, files, size, block):
+    paths = []
+    os.makedirs(root, exist_ok=True)
+    for i in range(files):
+        path = os.path.join(root, f"f{i:05d}.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size // len(block)):
+                f.write(block)
+        paths.append(path)
+    return paths
+
+
+def read_all(paths):
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as f:
+            while f.read(COPY_CHUNK_SIZE):
+                pass
+    return time.perf_counter() - start
+
+
+def bench_fadvise(args):
+    """Copy a tree with and without page-cache hints, then read the files a converter is about to use."""
+    if not kathana_copy.PAGE_CACHE_HINTS:
+        print("posix_fadvise is not available on this platform")
+        return
+    block = os.urandom(COPY_CHUNK_SIZE)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        convert_inputs = write_tree(os.path.join(tmp, "convert"), args.convert_mb, COPY_CHUNK_SIZE, block)
+        version_path = os.path.join(tmp, "Kathana3")
+        mesh_dir = os.path.join(version_path, "resource", "object", "NPC", "Mesh")
+        sources = write_tree(mesh_dir, args.copy_mb // 4, 4 * COPY_CHUNK_SIZE, block)
+        rows = [(i, f"E{i:05d}", os.path.basename(path)) for i, path in enumerate(sources)]
+
+        print(f"copy {args.copy_mb} MB, then convert-read {args.convert_mb} MB of cached inputs")
+        print(f"{'hints':<7}{'copy s':>8}{'cache growth MB':>17}{'dest resident':>15}{'inputs resident':>17}"
+              f"{'convert read s':>16}")
+        for hints in (False, True):
+            kathana_copy.drop_page_cache(sources)
+            read_all(convert_inputs)
+            kathana_copy.PAGE_CACHE_HINTS = hints
+            sorted_root = os.path.join(tmp, f"Sorted-{hints}")
+            plan = plan_entity_copies(rows, version_path, 'NPC', sorted_root=sorted_root)
+            create_destination_folders(plan, log_error=lambda message: None)
+            cached_before = meminfo_cached()
+            start = time.perf_counter()
+            asyncio.run(run_copy_jobs(plan.jobs, log_success=lambda message: None))
+            copy_seconds = time.perf_counter() - start
+            growth = (meminfo_cached() - cached_before) / 1024 ** 2
+            dest_resident = resident_fraction([job.dest for job in plan.jobs])
+            inputs_resident = resident_fraction(convert_inputs)
+            convert_seconds = read_all(convert_inputs)
+            print(f"{'on' if hints else 'off':<7}{copy_seconds:>8.2f}{growth:>17.0f}{dest_resident:>15.0%}"
+                  f"{inputs_resident:>17.0%}{convert_seconds:>16.2f}")
+            shutil.rmtree(sorted_root)
+        kathana_copy.PAGE_CACHE_HINTS = True
+
+
+def build_sorted_tree(root, version_name, folders, meshes, anims):
+    """Empty staged Sorted/<version>/<type>/<Folder> folders, as left by the copy step."""
+    count = 0
+    for entity_type in ('PC', 'NPC', 'Monster'):
+        for i in range(folders):
+            folder = os.path.join(root, version_name, entity_type, f"E{i:05d}")
+            os.makedirs(folder)
+            names = [f"m{j}.tmb" for j in range(meshes)] + [f"a{j:03d}.tab" for j in range(anims)]
+            for name in names:
+                open(os.path.join(folder, name), 'wb').close()
+            count += len(names)
+    return count
+
+
+def legacy_fbx_plan(sorted_root, fbx_root, version_name, entity_type):
+    """The os.walk loop generate_fbx_files used before the single-pass planner."""
+    root_dir = os.path.join(sorted_root, version_name, entity_type)
+    fbx_base_dir = os.path.join(fbx_root, version_name, entity_type)
+    os.makedirs(fbx_base_dir, exist_ok=True)
+    commands = []
+    for root, dirs, files in os.walk(root_dir):
+        for file in files:
+            if file.endswith(".tmb"):
+                tmb_path = os.path.join(root, file)
+                tab_files = [f for f in files if f.endswith(".tab")]
+                for tab_file in tab_files:
+                    tab_path = os.path.join(root, tab_file)
+                    output_file = os.path.join(fbx_base_dir, os.path.relpath(tab_path, root_dir)).replace(".tab", ".fbx")
+                    if not os.path.exists(os.path.dirname(output_file)):
+                        os.makedirs(os.path.dirname(output_file))
+                    commands.append(f'"noesis" ?cmode "{tmb_path}" "{output_file}" -loadanimsingle "{tab_path}"')
+    return commands
+
+
+def bench_fbxplan(args):
+    """Plan every FBX job of a large staged tree with the legacy walk and the single-pass planner."""
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        sorted_root = os.path.join(tmp, "Sorted")
+        files = build_sorted_tree(sorted_root, "Kathana3", args.folders, args.meshes, args.anims)
+        print(f"{files} files in {3 * args.folders} entity folders")
+        print(f"{'planner':<14}{'jobs':>9}{'seconds':>10}")
+        for name in ('legacy', 'single-pass'):
+            fbx_root = os.path.join(tmp, f"FBX-{name}")
+            start = time.perf_counter()
+            if name == 'legacy':
+                jobs = [command for entity_type in ('PC', 'NPC', 'Monster')
+                        for command in legacy_fbx_plan(sorted_root, fbx_root, "Kathana3", entity_type)]
+            else:
+                jobs = kathana_fbx.plan_fbx_version("Kathana3", sorted_root=sorted_root, fbx_root=fbx_root)
+                kathana_fbx.create_output_folders(job.output for job in jobs)
+            print(f"{name:<14}{len(jobs):>9}{time.perf_counter() - start:>10.2f}")
+
+
+def bench_pipeline(args):
+    """Convert a staged tree with the Noesis stand-in on pools of different sizes."""
+    fake_noesis = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kathana_fake_noesis.py")
+    os.environ.update({'KATHANA_FAKE_NOESIS_BASE': str(args.base), 'KATHANA_FAKE_NOESIS_PER_MB': str(args.per_mb),
+                       'KATHANA_FAKE_NOESIS_FAIL': str(args.fail), 'KATHANA_FAKE_NOESIS_HANG': str(args.hang)})
+    kathana_noesis.NOESIS_TIMEOUT_BASE = args.timeout
+    kathana_noesis.NOESIS_TIMEOUT_PER_MB = args.timeout
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        sorted_root = os.path.join(tmp, "Sorted")
+        for i in range(args.folders):
+            folder = os.path.join(sorted_root, "Kathana3", "NPC", f"E{i:04d}")
+            os.makedirs(folder)
+            names = [f"m{j}.tmb" for j in range(args.meshes)] + [f"a{j:02d}.tab" for j in range(args.anims)]
+            for name in names:
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(os.urandom(rng.randint(16, 512) * 1024))
+        jobs = kathana_fbx.plan_fbx_version("Kathana3", ['NPC'], sorted_root=sorted_root,
+                                            fbx_root=os.path.join(tmp, "FBX"))
+        kathana_fbx.create_output_folders(job.output for job in jobs)
+        print(f"{len(jobs)} conversions, {args.fail:.0%} failing, {args.hang:.0%} hanging "
+              f"(timeout {args.timeout:.0f}s + {args.timeout:.0f}s/MB)")
+        print(f"{'workers':>8}{'seconds':>10}{'ok':>7}{'failed':>8}{'timeouts':>10}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = kathana_noesis.run_noesis_jobs(jobs, fake_noesis, workers=workers, retries=0,
+                                                     log_success=lambda message: None,
+                                                     log_error=lambda message: None, metrics_path=None)
+            seconds = time.perf_counter() - start
+            ok = sum(result.ok for result in results)
+            timeouts = sum(result.killed == 'timeout' for result in results)
+            print(f"{workers:>8}{seconds:>10.2f}{ok:>7}{len(results) - ok:>8}{timeouts:>10}")
+
+
+def bench_stream(args):
+    """Copy everything then convert, against converting each entity as soon as its copies finish."""
+    fake_noesis = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kathana_fake_noesis.py")
+    os.environ.update({'KATHANA_FAKE_NOESIS_BASE': str(args.base), 'KATHANA_FAKE_NOESIS_PER_MB': str(args.per_mb)})
+    rng = random.Random(9)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        version_path = os.path.join(tmp, "Kathana3")
+        mesh_dir = os.path.join(version_path, "resource", "object", "NPC", "Mesh")
+        ani_dir = os.path.join(version_path, "resource", "object", "NPC", "Ani")
+        os.makedirs(mesh_dir)
+        os.makedirs(ani_dir)
+        rows = []
+        for i in range(args.entities):
+            names = [f"m{i:04d}.tmb"] + [f"a{i:04d}_{a:02d}.tab" for a in range(args.anims)]
+            for name in names:
+                with open(os.path.join(mesh_dir if name.endswith(".tmb") else ani_dir, name), 'wb') as f:
+                    f.write(os.urandom(rng.randint(64, 512) * 1024))
+            rows.append((i, f"E{i:04d}", names[0], None, None, None, *names[1:]))
+        print(f"{args.entities} entities, copies throttled to {args.copy_mb} MB/s, {args.workers} Noesis processes")
+
+        def quiet(message):
+            pass
+
+        for mode in ('sequential', 'streaming'):
+            sorted_root = os.path.join(tmp, mode, "Sorted")
+            fbx_root = os.path.join(tmp, mode, "FBX")
+            plan = plan_entity_copies(rows, version_path, 'NPC', sorted_root, log_error=quiet)
+            create_destination_folders(plan, log_error=quiet)
+            throttle = kathana_copy.CopyThrottle(args.copy_mb * 1024 * 1024)
+            start = time.perf_counter()
+            if mode == 'sequential':
+                asyncio.run(run_copy_jobs(plan.jobs, throttle=throttle, log_success=quiet, log_error=quiet))
+                copied_at = time.perf_counter() - start
+                jobs = kathana_fbx.plan_fbx_version(version_path, ['NPC'], sorted_root, fbx_root)
+                kathana_fbx.create_output_folders(job.output for job in jobs)
+                results = kathana_noesis.run_noesis_jobs(jobs, fake_noesis, workers=args.workers, log_success=quiet,
+                                                         log_error=quiet, metrics_path=None)
+            else:
+                stats = asyncio.run(kathana_pipeline.run_copy_convert_pipeline(
+                    [('NPC', plan)], version_path, fake_noesis, noesis_workers=args.workers, throttle=throttle,
+                    fbx_root=fbx_root, log_success=quiet, log_error=quiet, metrics_path=None))
+                copied_at = stats.copies_done_at
+                results = stats.results
+            seconds = time.perf_counter() - start
+            print(f"{mode:>11}: {seconds:6.2f}s total, copies done after {copied_at:5.2f}s, "
+                  f"{sum(result.ok for result in results)} conversions")
+
+
+def bench_multianim(args):
+    """Noesis launches and runtime of per-pair jobs against multi-animation jobs of several sizes."""
+    fake_noesis = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kathana_fake_noesis.py")
+    os.environ.update({'KATHANA_FAKE_NOESIS_BASE': str(args.base), 'KATHANA_FAKE_NOESIS_PER_MB': str(args.per_mb),
+                       'KATHANA_FAKE_NOESIS_SINGLE': '1' if args.single else '0'})
+    rng = random.Random(13)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        sorted_root = os.path.join(tmp, "Sorted")
+        for i in range(args.entities):
+            folder = os.path.join(sorted_root, "Kathana3", "Monster", f"E{i:04d}")
+            os.makedirs(folder)
+            with open(os.path.join(folder, "m.tmb"), 'wb') as f:
+                f.write(os.urandom(rng.randint(256, 1024) * 1024))
+            for a in range(args.anims):
+                with open(os.path.join(folder, f"a{a:02d}.tab"), 'wb') as f:
+                    f.write(os.urandom(rng.randint(4, 32) * 1024))
+        pairs = kathana_fbx.plan_fbx_version("Kathana3", ['Monster'], sorted_root, os.path.join(tmp, "FBX"))
+        kathana_fbx.create_output_folders(job.output for job in pairs)
+        print(f"{len(pairs)} mesh/animation pairs, {args.workers} Noesis processes"
+              f"{', stand-in keeps one animation per run' if args.single else ''}")
+        print(f"{'anims/run':>10}{'launches':>10}{'saved':>8}{'seconds':>10}{'ok':>7}")
+        for anims_per_job in args.anims_per_job:
+            jobs = kathana_fbx.group_animations(pairs, anims_per_job)
+            launches = []
+            real_run = kathana_noesis.run_noesis_job
+
+            def counted_run(*run_args, **run_kwargs):
+                launches.append(1)
+                return real_run(*run_args, **run_kwargs)
+
+            kathana_noesis.run_noesis_job = counted_run
+            start = time.perf_counter()
+            try:
+                results = kathana_noesis.run_noesis_jobs(jobs, fake_noesis, workers=args.workers, retries=0,
+                                                         log_success=lambda message: None,
+                                                         log_error=lambda message: None, metrics_path=None,
+                                                         caps_path=None)
+            finally:
+                kathana_noesis.run_noesis_job = real_run
+            seconds = time.perf_counter() - start
+            print(f"{anims_per_job:>10}{len(launches):>10}{len(pairs) - len(launches):>8}{seconds:>10.2f}"
+                  f"{sum(result.ok for result in results):>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kathana Development Kit benchmarks")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('schedule', help="row-order vs largest-first copy scheduling")
+    p.add_argument('--entities', type=int, default=400)
+    p.add_argument('--huge', type=int, default=30, help="number of huge entities at the end of the sheet")
+    p.add_argument('--slots', type=int, default=20)
+    p.add_argument('--bandwidth', type=float, default=40.0, help="MB/s per copy slot")
+    p.add_argument('--latency', type=float, default=0.005, help="per-file open/close cost in seconds")
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser('seek', help="row-order vs locality ordering on a simulated HDD")
+    p.add_argument('--entities', type=int, default=600)
+    p.add_argument('--bandwidth', type=float, default=150.0, help="sequential MB/s")
+    p.add_argument('--track-seek', type=float, default=0.001, help="track-to-track seek in seconds")
+    p.add_argument('--full-seek', type=float, default=0.018, help="full-stroke seek in seconds")
+    p.set_defaults(func=bench_seek)
+
+    p = sub.add_parser('fadvise', help="copy-then-convert with and without posix_fadvise hints (Linux)")
+    p.add_argument('--copy-mb', type=int, default=1024)
+    p.add_argument('--convert-mb', type=int, default=256)
+    p.add_argument('--dir', default=None, help="scratch directory on the disk to test")
+    p.set_defaults(func=bench_fadvise)
+
+    p = sub.add_parser('fbxplan', help="legacy os.walk FBX loop vs the single-pass planner")
+    p.add_argument('--folders', type=int, default=1000, help="entity folders per type")
+    p.add_argument('--meshes', type=int, default=2, help=".tmb files per folder")
+    p.add_argument('--anims', type=int, default=31, help=".tab files per folder")
+    p.add_argument('--dir', default=None, help="scratch directory on the disk to test")
+    p.set_defaults(func=bench_fbxplan)
+
+    p = sub.add_parser('pipeline', help="end-to-end Noesis pool runs with the stand-in converter")
+    p.add_argument('--folders', type=int, default=30)
+    p.add_argument('--meshes', type=int, default=1)
+    p.add_argument('--anims', type=int, default=4)
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    p.add_argument('--base', type=float, default=0.05, help="stand-in seconds per launch")
+    p.add_argument('--per-mb', type=float, default=0.5, help="stand-in seconds per MB of input")
+    p.add_argument('--fail', type=float, default=0.02, help="fraction of jobs that fail")
+    p.add_argument('--hang', type=float, default=0.02, help="fraction of jobs that hang")
+    p.add_argument('--timeout', type=float, default=2.0, help="job timeout base and per-MB seconds")
+    p.add_argument('--dir', default=None, help="scratch directory on the disk to test")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('stream', help="copy-then-convert vs per-entity streaming with the stand-in converter")
+    p.add_argument('--entities', type=int, default=40)
+    p.add_argument('--anims', type=int, default=3)
+    p.add_argument('--workers', type=int, default=8)
+    p.add_argument('--copy-mb', type=float, default=20.0, help="copy bandwidth limit in MB/s")
+    p.add_argument('--base', type=float, default=0.05, help="stand-in seconds per launch")
+    p.add_argument('--per-mb', type=float, default=0.5, help="stand-in seconds per MB of input")
+    p.add_argument('--dir', default=None, help="scratch directory on the disk to test")
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser('multianim', help="Noesis launches saved by multi-animation jobs")
+    p.add_argument('--entities', type=int, default=12)
+    p.add_argument('--anims', type=int, default=20, help=".tab files per entity")
+    p.add_argument('--anims-per-job', type=int, nargs='+', default=[1, 10, 70])
+    p.add_argument('--workers', type=int, default=8)
+    p.add_argument('--base', type=float, default=0.3, help="stand-in seconds per launch, Noesis startup and mesh load")
+    p.add_argument('--per-mb', type=float, default=0.2, help="stand-in seconds per MB of input")
+    p.add_argument('--single', action='store_true', help="stand-in keeps only one animation, to exercise the fallback")
+    p.add_argument('--dir', default=None, help="scratch directory on the disk to test")
+    p.set_defaults(func=bench_multianim)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,616 @@
+import os
+import sys
+import json
+import shutil
+import stat
+import time
+import subprocess
+import asyncio
+import logging
+import contextlib
+import aiofiles
+from dataclasses import dataclass, field
+from collections import Counter
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+SORTED_ROOT = r"B:\\Kathana-Out\\Sorted"
+
+# Size of each read/write when streaming a file through the copy engine
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Order in which planned copies are handed to the copy slots
+COPY_POLICIES = ('row', 'largest_first', 'locality')
+
+# Concurrent copies allowed per device, by device kind; spinning disks thrash with more than a couple
+DEVICE_BUDGETS = {'ssd': 20, 'network': 8, 'hdd': 2}
+
+# Filesystems that live on the other end of a network link
+NETWORK_FSTYPES = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'sshfs', 'fuse.sshfs', '9p', 'afs')
+
+# Throughput of finished copy runs, used to estimate how long a planned job will take
+COPY_HISTORY_PATH = os.path.join(os.getcwd(), "KATHANA_COPY_HISTORY.json")
+COPY_HISTORY_RUNS = 20
+
+# Linux page-cache hints; Windows has no posix_fadvise and manages its cache on its own
+PAGE_CACHE_HINTS = hasattr(os, 'posix_fadvise')
+
+# Extra path prefixes to treat as spinning disks, separated by os.pathsep (e.g. "B:\\Archive;D:\\")
+HDD_ROOTS_ENV = 'KATHANA_HDD_ROOTS'
+
+
+class TokenBucket:
+    """Asyncio token bucket. A rate of 0 disables the limit."""
+
+    def __init__(self, rate=0, burst=None):
+        self.rate = 0
+        self.burst = 0
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.set_rate(rate, burst)
+        self.tokens = self.burst
+
+    def set_rate(self, rate, burst=None):
+        """Change the refill rate; safe to call from another thread while a job runs."""
+        self.rate = max(0, rate or 0)
+        self.burst = burst if burst else max(self.rate, 1)
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Wait until `amount` tokens are available and take them."""
+        while self.rate:
+            self._refill()
+            # Requests larger than the bucket are let through once it is full
+            needed = min(amount, self.burst)
+            if self.tokens >= needed:
+                self.tokens -= needed
+                return
+            await asyncio.sleep(min((needed - self.tokens) / self.rate, 0.25))
+
+
+class CopyThrottle:
+    """Bytes-per-second and files-per-second limits plus throughput counters for a copy job."""
+
+    def __init__(self, bytes_per_sec=0, files_per_sec=0):
+        self.bytes_bucket = TokenBucket()
+        self.files_bucket = TokenBucket()
+        self.set_limits(bytes_per_sec, files_per_sec)
+        self.reset()
+
+    def set_limits(self, bytes_per_sec=None, files_per_sec=None):
+        """Adjust the limits; None leaves a limit unchanged and 0 removes it."""
+        if bytes_per_sec is not None:
+            # One chunk of burst keeps a single large read from stalling forever
+            self.bytes_bucket.set_rate(bytes_per_sec, max(bytes_per_sec, COPY_CHUNK_SIZE))
+        if files_per_sec is not None:
+            self.files_bucket.set_rate(files_per_sec)
+
+    def reset(self):
+        """Reset the throughput counters at the start of a job."""
+        self.bytes_copied = 0
+        self.files_copied = 0
+        self.started = time.monotonic()
+
+    def throughput(self):
+        """Return the effective (bytes/s, files/s) since the last reset."""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return self.bytes_copied / elapsed, self.files_copied / elapsed
+
+
+def format_rate(bytes_per_sec):
+    """Format a byte rate for display."""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if bytes_per_sec < 1024:
+            return f"{bytes_per_sec:.1f} {unit}"
+        bytes_per_sec /= 1024
+    return f"{bytes_per_sec:.1f} GB/s"
+
+
+def _fadvise(fd, advice):
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    except OSError as e:
+        logger.debug(f"posix_fadvise failed: {e}")
+
+
+def drop_page_cache(paths):
+    """Ask the kernel to drop the cached pages of files that were written earlier.
+
+    DONTNEED only drops clean pages, so the hint given when a copy closes mostly
+    starts writeback; this second pass, once the job is done, releases the pages.
+    """
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            _fadvise(fd, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+async def throttled_copy(src_file, dest_file, throttle=None, keep_cached=False):
+    """Stream src_file to dest_file in chunks, honouring the throttle if one is given.
+
+    On Linux the source is read with a sequential hint and both files are
+    dropped from the page cache afterwards, unless keep_cached says a converter
+    is about to read the destination.
+    """
+    if throttle:
+        await throttle.files_bucket.acquire()
+    async with aiofiles.open(src_file, 'rb') as src, aiofiles.open(dest_file, 'wb') as dest:
+        if PAGE_CACHE_HINTS:
+            _fadvise(src.fileno(), os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            chunk = await src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            if throttle:
+                await throttle.bytes_bucket.acquire(len(chunk))
+            await dest.write(chunk)
+            if throttle:
+                throttle.bytes_copied += len(chunk)
+        if PAGE_CACHE_HINTS:
+            _fadvise(src.fileno(), os.POSIX_FADV_DONTNEED)
+            if not keep_cached:
+                await dest.flush()
+                _fadvise(dest.fileno(), os.POSIX_FADV_DONTNEED)
+    if throttle:
+        throttle.files_copied += 1
+
+
+def _windows_media_type(path):
+    """Ask Storage Management for the media type (HDD/SSD/Unspecified) behind a drive letter."""
+    drive = os.path.splitdrive(os.path.abspath(path))[0].rstrip(':')
+    if len(drive) != 1:
+        return None
+    command = (f"(Get-Partition -DriveLetter {drive} | Get-Disk | Get-PhysicalDisk).MediaType")
+    try:
+        result = subprocess.run(['powershell', '-NoProfile', '-Command', command],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"Could not query media type for {path}: {e}")
+        return None
+    return result.stdout.strip() or None
+
+
+def _linux_rotational(path):
+    """Read the block queue's rotational flag for the device holding path."""
+    dev = os.stat(path).st_dev
+    block = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    # Partitions keep the queue on their parent disk
+    for queue in (os.path.join(block, "queue", "rotational"), os.path.join(block, "..", "queue", "rotational")):
+        try:
+            with open(queue) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+
+def _is_network_path(path):
+    """Return True if path is on a network share (UNC path, mapped drive or network mount)."""
+    path = os.path.abspath(path)
+    if sys.platform == 'win32':
+        if path.startswith('\\\\'):
+            return True
+        import ctypes
+        drive = os.path.splitdrive(path)[0]
+        # DRIVE_REMOTE == 4
+        return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == 4
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    best = ('', '')
+    for mount_point, fstype in mounts:
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best[0]):
+            best = (mount_point, fstype)
+    return best[1] in NETWORK_FSTYPES
+
+
+def existing_parent(path):
+    """Return path or its nearest ancestor that exists."""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+_device_kind_cache = {}
+
+
+def _is_under(path, root):
+    """True if path is root or inside it; B:\\Kathana3 does not contain B:\\Kathana3.2."""
+    path = os.path.normcase(os.path.abspath(path))
+    root = os.path.normcase(os.path.abspath(root))
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # Different drives
+        return False
+
+
+def device_kind(path):
+    """Classify the device holding path as 'hdd', 'network' or 'ssd'. Unknown devices count as SSDs."""
+    roots = [root for root in os.environ.get(HDD_ROOTS_ENV, '').split(os.pathsep) if root]
+    if any(_is_under(path, root) for root in roots):
+        return 'hdd'
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return 'ssd'
+    if dev not in _device_kind_cache:
+        if _is_network_path(path):
+            kind = 'network'
+        elif sys.platform == 'win32':
+            kind = 'hdd' if _windows_media_type(path) == 'HDD' else 'ssd'
+        elif sys.platform.startswith('linux'):
+            kind = 'hdd' if _linux_rotational(path) else 'ssd'
+        else:
+            kind = 'ssd'
+        _device_kind_cache[dev] = kind
+    return _device_kind_cache[dev]
+
+
+def choose_copy_policy(version_path):
+    """Pick the read-ordering policy for a version's source device."""
+    if device_kind(version_path) == 'hdd':
+        return 'locality'
+    return 'largest_first'
+
+
+class DevicePools:
+    """One semaphore per st_dev, so each device is limited by its own concurrency budget."""
+
+    def __init__(self, budgets=None):
+        self.budgets = dict(DEVICE_BUDGETS, **(budgets or {}))
+        self.semaphores = {}
+        self.kinds = {}
+        self.folder_devices = {}
+
+    def device_of(self, path):
+        """Return the st_dev of the folder holding path, registering a pool for new devices."""
+        folder = os.path.dirname(path)
+        if folder not in self.folder_devices:
+            # Destination folders may not exist yet; their nearest existing parent is on the same device
+            probe = existing_parent(folder)
+            try:
+                dev = os.stat(probe).st_dev
+            except OSError:
+                dev = None
+            if dev not in self.semaphores:
+                kind = device_kind(probe)
+                self.kinds[dev] = kind
+                self.semaphores[dev] = asyncio.Semaphore(self.budgets[kind])
+                logger.debug(f"Device {dev} ({probe}): {kind}, {self.budgets[kind]} concurrent copies")
+            self.folder_devices[folder] = dev
+        return self.folder_devices[folder]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, job):
+        """Hold a slot on the source and destination devices of a job."""
+        devices = {self.device_of(job.src), self.device_of(job.dest)}
+        async with contextlib.AsyncExitStack() as stack:
+            # A fixed acquisition order keeps two jobs copying in opposite directions from deadlocking
+            for dev in sorted(devices, key=str):
+                await stack.enter_async_context(self.semaphores[dev])
+            yield
+
+
+@dataclass
+class CopyJob:
+    """A single source file to copy into a Sorted entity folder."""
+    src: str
+    dest: str
+    size: int = None
+    row: int = 0
+    inode: int = 0
+    position: int = 0
+    # Leave the copy in the page cache because a converter will read it soon
+    keep_cached: bool = False
+
+
+@dataclass
+class CopyPlan:
+    """Copy jobs for one entity sheet, plus each row's destination folder and its jobs."""
+    jobs: list
+    folders: list
+
+
+def scan_file_stats(directory):
+    """Return {file name: (size, inode, directory position)} for a source folder using one scandir pass."""
+    stats = {}
+    try:
+        with os.scandir(directory) as entries:
+            for position, entry in enumerate(entries):
+                if entry.is_file():
+                    stats[entry.name.lower()] = (entry.stat().st_size, entry.inode(), position)
+    except OSError as e:
+        logger.debug(f"Could not scan {directory}: {e}")
+    return stats
+
+
+def plan_entity_copies(rows, version_path, entity_type, sorted_root=SORTED_ROOT, log_error=logger.error):
+    """Build the copy plan for the rows of an entity sheet (ID, Folder_Name, Mesh1-4, Ani1-70)."""
+    version_name = os.path.basename(version_path)
+    mesh_dir = os.path.join(version_path, "resource", "object", entity_type, "Mesh")
+    ani_dir = os.path.join(version_path, "resource", "object", entity_type, "Ani")
+    mesh_stats = scan_file_stats(mesh_dir)
+    ani_stats = scan_file_stats(ani_dir)
+
+    jobs = []
+    folders = []
+    for row_index, row in enumerate(rows):
+        folder_name = row[1]
+        if not folder_name:
+            log_error(f"Missing Folder_Name in row: {row}")
+            continue
+
+        dest_dir = os.path.join(sorted_root, version_name, entity_type, folder_name)
+        row_jobs = []
+        for src_dir, stats, names in ((mesh_dir, mesh_stats, row[2:6]), (ani_dir, ani_stats, row[6:])):
+            for name in names:
+                if name:
+                    size, inode, position = stats.get(str(name).lower(), (None, 0, 0))
+                    row_jobs.append(CopyJob(os.path.join(src_dir, name), os.path.join(dest_dir, name),
+                                            size, row_index, inode, position))
+        jobs.extend(row_jobs)
+        folders.append((dest_dir, row_jobs))
+    return CopyPlan(jobs, folders)
+
+
+@dataclass
+class FolderStats:
+    """Filesystem metadata operations spent creating destination folders for one plan."""
+    created: int = 0
+    skipped_empty: int = 0
+    metadata_ops: int = 0
+    # What the old per-row exists + makedirs (+ rmtree of empty rows) approach would have spent
+    per_row_ops: int = 0
+
+    @property
+    def saved(self):
+        return self.per_row_ops - self.metadata_ops
+
+
+def create_destination_folders(plan, max_workers=8, log_error=logger.error):
+    """Create every non-empty destination folder of a plan in one batched, parallel pass.
+
+    Parents shared by many entity folders (Sorted/<version>/<type>) are created
+    once, then each entity folder is a single mkdir. Rows without files never get
+    a folder, so nothing has to be removed afterwards.
+    """
+    stats = FolderStats()
+    folders = set()
+    for dest_dir, row_jobs in plan.folders:
+        # exists + makedirs for every row, plus scandir + rmdir to remove it again if empty
+        stats.per_row_ops += 2
+        if row_jobs:
+            folders.add(dest_dir)
+        else:
+            stats.per_row_ops += 2
+            stats.skipped_empty += 1
+            log_error(f"Skipped empty directory: {dest_dir}")
+
+    parents = {os.path.dirname(folder) for folder in folders}
+    for parent in parents:
+        os.makedirs(parent, exist_ok=True)
+    stats.metadata_ops += len(parents)
+
+    def make_folder(folder):
+        try:
+            os.mkdir(folder)
+            return True
+        except FileExistsError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for created in executor.map(make_folder, sorted(folders)):
+            stats.metadata_ops += 1
+            stats.created += created
+    return stats
+
+
+def load_copy_history(history_path=COPY_HISTORY_PATH):
+    """Return the recorded copy runs as a list of {bytes, files, seconds} dicts."""
+    try:
+        with open(history_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def record_copy_run(bytes_copied, files_copied, seconds, history_path=COPY_HISTORY_PATH):
+    """Append a finished run to the throughput history, keeping the most recent runs."""
+    if not files_copied or seconds <= 0:
+        return
+    runs = load_copy_history(history_path)
+    runs.append({'bytes': bytes_copied, 'files': files_copied, 'seconds': seconds})
+    try:
+        with open(history_path, 'w') as f:
+            json.dump(runs[-COPY_HISTORY_RUNS:], f, indent=1)
+    except OSError as e:
+        logger.debug(f"Could not save copy history: {e}")
+
+
+def estimate_copy_seconds(total_bytes, files, history):
+    """Estimate runtime from past runs as seconds = a * bytes + b * files.
+
+    a and b come from a least-squares fit over the history, which separates
+    bandwidth from per-file cost; with too little history the aggregate
+    throughput is used instead. Returns None without any history.
+    """
+    if not history:
+        return None
+    sbb = sum(run['bytes'] ** 2 for run in history)
+    sff = sum(run['files'] ** 2 for run in history)
+    sbf = sum(run['bytes'] * run['files'] for run in history)
+    sbt = sum(run['bytes'] * run['seconds'] for run in history)
+    sft = sum(run['files'] * run['seconds'] for run in history)
+    det = sbb * sff - sbf ** 2
+    if det > 0:
+        per_byte = (sbt * sff - sft * sbf) / det
+        per_file = (sft * sbb - sbt * sbf) / det
+        if per_byte >= 0 and per_file >= 0:
+            return per_byte * total_bytes + per_file * files
+    seconds = sum(run['seconds'] for run in history)
+    return max(total_bytes / max(sum(run['bytes'] for run in history) / seconds, 1),
+               files / max(sum(run['files'] for run in history) / seconds, 1e-9))
+
+
+@dataclass
+class PlanEstimate:
+    """What a copy plan would do, computed without touching any data."""
+    files: int = 0
+    total_bytes: int = 0
+    folders: int = 0
+    skipped_empty: int = 0
+    missing: list = field(default_factory=list)
+    duplicate_sources: dict = field(default_factory=dict)
+    free_bytes: int = None
+    estimated_seconds: float = None
+
+
+def estimate_plans(plans, sorted_root=SORTED_ROOT, history_path=COPY_HISTORY_PATH):
+    """Summarise one or more copy plans: file count, bytes, duplicates, missing sources,
+    destination folders, free space on the destination and estimated runtime."""
+    estimate = PlanEstimate()
+    sources = Counter()
+    folders = set()
+    for plan in plans:
+        for dest_dir, row_jobs in plan.folders:
+            if row_jobs:
+                folders.add(dest_dir)
+            else:
+                estimate.skipped_empty += 1
+        for job in plan.jobs:
+            sources[job.src] += 1
+            if job.size is None:
+                estimate.missing.append(job.src)
+            else:
+                estimate.files += 1
+                estimate.total_bytes += job.size
+    estimate.folders = len(folders)
+    estimate.duplicate_sources = {src: count for src, count in sources.items() if count > 1}
+    try:
+        estimate.free_bytes = shutil.disk_usage(existing_parent(sorted_root)).free
+    except OSError:
+        pass
+    estimate.estimated_seconds = estimate_copy_seconds(estimate.total_bytes, estimate.files,
+                                                       load_copy_history(history_path))
+    return estimate
+
+
+def format_plan_estimate(estimate, title="Dry run"):
+    """Return the report lines for a PlanEstimate."""
+    gib = 1024 ** 3
+    lines = [f"{title}: {estimate.files} files, {estimate.total_bytes / gib:.2f} GB "
+             f"into {estimate.folders} folders ({estimate.skipped_empty} empty rows skipped)"]
+    if estimate.free_bytes is not None:
+        status = "OK" if estimate.free_bytes >= estimate.total_bytes else "NOT ENOUGH SPACE"
+        lines.append(f"  Free space needed: {estimate.total_bytes / gib:.2f} GB, "
+                     f"available: {estimate.free_bytes / gib:.2f} GB ({status})")
+    lines.append(f"  Missing sources: {len(estimate.missing)}")
+    for src in estimate.missing[:20]:
+        lines.append(f"    {src}")
+    duplicated = sum(count - 1 for count in estimate.duplicate_sources.values())
+    lines.append(f"  Duplicate sources: {len(estimate.duplicate_sources)} files copied {duplicated} extra times")
+    if estimate.estimated_seconds is None:
+        lines.append("  Estimated runtime: unknown (no finished copy runs recorded yet)")
+    else:
+        lines.append(f"  Estimated runtime: {timedelta(seconds=round(estimate.estimated_seconds))}")
+    return lines
+
+
+def order_copy_jobs(jobs, policy='largest_first'):
+    """Return the jobs in the order they should be started.
+
+    'largest_first' is the LPT rule: starting the big files first keeps them from
+    landing at the end of the queue and setting the makespan while other slots sit idle.
+    'locality' reads each source folder in inode order (directory order where the
+    filesystem has no inode numbers), a cheap proxy for on-disk layout on HDDs.
+    """
+    if policy == 'row':
+        return list(jobs)
+    if policy == 'largest_first':
+        # Missing sources (size None) only log an error, so they go last
+        return sorted(jobs, key=lambda job: -1 if job.size is None else job.size, reverse=True)
+    if policy == 'locality':
+        return sorted(jobs, key=lambda job: (os.path.dirname(job.src), job.inode, job.position))
+    raise ValueError(f"Unknown copy policy: {policy}")
+
+
+def replace_file(tmp_path, dest):
+    """Move tmp_path over dest without writing into dest's inode.
+
+    dest may be a hard link into the asset store or to a duplicate's copy;
+    replacing it only drops this name, so the other links keep their data.
+    """
+    try:
+        os.replace(tmp_path, dest)
+    except PermissionError:
+        # Windows will not replace a read-only file such as a store link; the flag is all that changes
+        os.chmod(dest, stat.S_IWRITE | stat.S_IREAD)
+        os.replace(tmp_path, dest)
+
+
+async def copy_file_async(job, throttle=None, log_success=logger.info, log_error=logger.error):
+    """Copy one planned file, logging the outcome. Returns True on success."""
+    if os.path.isfile(job.src):
+        tmp_path = f"{job.dest}.{os.getpid()}.tmp"
+        try:
+            await throttled_copy(job.src, tmp_path, throttle, job.keep_cached)
+            os.chmod(tmp_path, stat.S_IWRITE)
+            # Keep the source times so incremental FBX builds see an unchanged asset as unchanged
+            src_stat = os.stat(job.src)
+            os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+            replace_file(tmp_path, job.dest)
+            log_success(f"Copied {job.src} to {job.dest}")
+            return True
+        except Exception as e:
+            log_error(f"Error copying {job.src} to {job.dest}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+    else:
+        log_error(f"File not found: {job.src}")
+    return False
+
+
+async def run_copy_jobs(jobs, pools=None, throttle=None, log_success=logger.info, log_error=logger.error,
+                        progress_callback=None, should_stop=None, job_callback=None):
+    """Run the jobs in the given order, limited per source and destination device.
+
+    job_callback(job, ok) is called on the event loop as each copy ends.
+    """
+    pools = pools or DevicePools()
+    total = len(jobs)
+    completed = 0
+    uncached = []
+
+    async def run_job(job):
+        nonlocal completed
+        async with pools.hold(job):
+            if should_stop and should_stop():
+                return
+            ok = await copy_file_async(job, throttle, log_success, log_error)
+            if ok and not job.keep_cached:
+                uncached.append(job.dest)
+        if job_callback:
+            job_callback(job, ok)
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, total)
+
+    # Tasks queue on each device's semaphore in creation order, so the list order is the start order
+    await asyncio.gather(*(run_job(job) for job in jobs))
+    if PAGE_CACHE_HINTS and uncached:
+        await asyncio.to_thread(drop_page_cache, uncached)
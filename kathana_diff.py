@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+from kathana_copy import CopyPlan
+from kathana_digest import DigestCache, format_cache_stats
+from kathana_store import STORE_ROOT, ENTITY_TYPES, asset_key, iter_version_assets
+
+logger = logging.getLogger()
+
+INDEX_DIR = os.path.join(STORE_ROOT, "indexes")
+DIFF_DIR = os.path.join(STORE_ROOT, "diffs")
+
+
+class VersionIndex:
+    """Cached size, mtime and digest of every Mesh and Ani file of a version.
+
+    Digests are computed lazily through the shared digest cache and reused for
+    as long as size and mtime are unchanged.
+    """
+
+    def __init__(self, version_path, index_dir=INDEX_DIR):
+        self.version_path = version_path
+        self.path = os.path.join(index_dir, f"{os.path.basename(version_path)}.json")
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        self.entries = {}
+        self.assets = {}
+        for path, st in iter_version_assets(version_path):
+            key = asset_key(version_path, path)
+            old = cached.get(key)
+            digest = old[2] if old and old[0] == st.st_size and old[1] == st.st_mtime_ns else None
+            self.entries[key] = [st.st_size, st.st_mtime_ns, digest]
+            self.assets[key] = (path, st)
+
+    def digests(self, keys, cache, max_workers=None):
+        """Return {key: digest}, hashing only the files whose digest is in neither index nor cache."""
+        stale = [key for key in keys if self.entries[key][2] is None]
+        digests = cache.digests([self.assets[key] for key in stale], max_workers=max_workers)
+        for key in stale:
+            self.entries[key][2] = digests[self.assets[key][0]]
+        return {key: self.entries[key][2] for key in keys}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def entity_type_of(key):
+    """Return the entity type of an asset key such as 'resource/object/pc/mesh/x.tmb'."""
+    part = key.split('/')[2]
+    return next((entity_type for entity_type in ENTITY_TYPES if entity_type.lower() == part), part)
+
+
+def diff_versions(old_path, new_path, index_dir=INDEX_DIR, cache=None):
+    """Compare two version roots; returns {entity type: {'added', 'removed', 'changed'}: [asset keys]}.
+
+    Files with different sizes are changed without hashing; only same-size
+    files present in both versions need digests, and those come from the
+    cached indexes when the files have not been touched.
+    """
+    old_index = VersionIndex(old_path, index_dir)
+    new_index = VersionIndex(new_path, index_dir)
+    old_keys = set(old_index.entries)
+    new_keys = set(new_index.entries)
+    common = old_keys & new_keys
+    same_size = [key for key in common if old_index.entries[key][0] == new_index.entries[key][0]]
+    own_cache = cache is None
+    cache = cache or DigestCache()
+    try:
+        old_digests = old_index.digests(same_size, cache)
+        new_digests = new_index.digests(same_size, cache)
+    finally:
+        if own_cache:
+            cache.close()
+    logger.info(format_cache_stats(cache))
+    changed = {key for key in common if old_index.entries[key][0] != new_index.entries[key][0]}
+    changed.update(key for key in same_size if old_digests[key] != new_digests[key])
+    old_index.save()
+    new_index.save()
+
+    report = {entity_type: {'added': [], 'removed': [], 'changed': []} for entity_type in ENTITY_TYPES}
+    for kind, keys in (('added', new_keys - old_keys), ('removed', old_keys - new_keys), ('changed', changed)):
+        for key in sorted(keys):
+            report.setdefault(entity_type_of(key), {'added': [], 'removed': [], 'changed': []})[kind].append(key)
+    return report
+
+
+def diff_path(new_version_name, diff_dir=DIFF_DIR):
+    return os.path.join(diff_dir, f"{new_version_name}.json")
+
+
+def save_diff(old_path, new_path, report, diff_dir=DIFF_DIR):
+    """Save a diff as the current delta of the new version."""
+    os.makedirs(diff_dir, exist_ok=True)
+    with open(diff_path(os.path.basename(new_path), diff_dir), 'w') as f:
+        json.dump({'old': old_path, 'new': new_path, 'types': report}, f, indent=1)
+
+
+def load_delta(new_version_name, entity_type, diff_dir=DIFF_DIR):
+    """Return the lower-case file names added or changed for an entity type in the last saved diff, or None."""
+    try:
+        with open(diff_path(new_version_name, diff_dir)) as f:
+            report = json.load(f)['types']
+    except (OSError, ValueError, KeyError):
+        return None
+    kinds = report.get(entity_type, {})
+    return {key.rsplit('/', 1)[-1] for kind in ('added', 'changed') for key in kinds.get(kind, [])}
+
+
+def filter_plan_to_delta(plan, names):
+    """Keep only the entity rows that reference an added or changed file.
+
+    Whole rows are kept so the entity folder still holds every mesh and
+    animation Noesis needs to pair.
+    """
+    folders = [(dest_dir, row_jobs) for dest_dir, row_jobs in plan.folders
+               if any(os.path.basename(job.src).lower() in names for job in row_jobs)]
+    return CopyPlan([job for dest_dir, row_jobs in folders for job in row_jobs], folders)
+
+
+def format_diff(report):
+    lines = []
+    for entity_type, kinds in report.items():
+        lines.append(f"{entity_type}: {len(kinds['added'])} added, {len(kinds['removed'])} removed, "
+                     f"{len(kinds['changed'])} changed")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List Mesh and Ani files added, removed or changed between versions")
+    parser.add_argument('old_version')
+    parser.add_argument('new_version')
+    parser.add_argument('--list', action='store_true', help="print every changed asset")
+    parser.add_argument('--no-save', action='store_true', help="do not save the diff as the new version's delta")
+    args = parser.parse_args(argv)
+
+    report = diff_versions(args.old_version, args.new_version)
+    if not args.no_save:
+        save_diff(args.old_version, args.new_version, report)
+    for line in format_diff(report):
+        logger.info(line)
+    if args.list:
+        for entity_type, kinds in report.items():
+            for kind, keys in kinds.items():
+                for key in keys:
+                    logger.info(f"{kind:<8}{key}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
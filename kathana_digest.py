@@ -0,0 +1,196 @@
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger()
+
+# Content digests identify assets across versions; blake2b is the fastest strong hash in hashlib
+DIGEST_SIZE = 20
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+DIGEST_CACHE_PATH = os.path.join(os.getcwd(), "KATHANA_DIGESTS.sqlite")
+DIGEST_CACHE_BATCH = 500
+# Bumped whenever file_digest changes; a cache written by another scheme is discarded on open
+DIGEST_SCHEME = f"blake2b-{DIGEST_SIZE}"
+
+
+def file_digest(path, chunk_size=DIGEST_CHUNK_SIZE):
+    """Return the hex blake2b digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class DigestCache:
+    """Persistent (path, size, mtime_ns, inode) -> digest cache kept in SQLite.
+
+    An entry is valid only while the file keeps the same size, mtime_ns and
+    inode; any difference is a miss and the entry is replaced once the file is
+    re-hashed. Inodes are only compared when both sides know them, since
+    os.scandir on Windows reports 0. Entries of deleted files are removed by
+    prune(), and the whole cache is dropped if DIGEST_SCHEME changes.
+
+    The database runs in WAL mode so other processes can read while a fill is
+    writing; writes are buffered and committed in batches.
+    """
+
+    def __init__(self, path=DIGEST_CACHE_PATH, batch_size=DIGEST_CACHE_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        # Bytes read to hash files the cache could not answer for
+        self.bytes_hashed = 0
+        self.pending = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, "
+                        "mtime_ns INTEGER, inode INTEGER, digest TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'scheme'").fetchone()
+        if row is None or row[0] != DIGEST_SCHEME:
+            with self.db:
+                self.db.execute("DELETE FROM digests")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('scheme', ?)", (DIGEST_SCHEME,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, path, st=None):
+        """Return the cached digest of a file if it is still valid, else None."""
+        st = st or os.stat(path)
+        key = cache_key(path)
+        row = self.pending.get(key)
+        if row is None:
+            row = self.db.execute("SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ?",
+                                  (key,)).fetchone()
+        if row is not None:
+            size, mtime_ns, inode, digest = row
+            if size == st.st_size and mtime_ns == st.st_mtime_ns and (not inode or not st.st_ino or inode == st.st_ino):
+                self.hits += 1
+                return digest
+        self.misses += 1
+        return None
+
+    def record(self, path, st, digest):
+        """Queue a digest for the next batched write."""
+        self.pending[cache_key(path)] = (st.st_size, st.st_mtime_ns, st.st_ino, digest)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                                [(key, *row) for key, row in self.pending.items()])
+        self.pending.clear()
+
+    def digest(self, path, st=None):
+        """Return a file's digest, hashing it only on a cache miss."""
+        st = st or os.stat(path)
+        digest = self.lookup(path, st)
+        if digest is None:
+            digest = file_digest(path)
+            self.bytes_hashed += st.st_size
+            self.record(path, st, digest)
+        return digest
+
+    def digests(self, assets, max_workers=None, progress_callback=None):
+        """Return {path: digest} for (path, os.stat_result) pairs, hashing misses in a process pool."""
+        result = {}
+        misses = []
+        for path, st in assets:
+            digest = self.lookup(path, st)
+            if digest is None:
+                misses.append((path, st))
+            else:
+                result[path] = digest
+        total = len(result) + len(misses)
+        if progress_callback:
+            progress_callback(len(result), total)
+        if misses:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                paths = [path for path, st in misses]
+                for done, ((path, st), digest) in enumerate(
+                        zip(misses, executor.map(file_digest, paths, chunksize=16)), start=len(result) + 1):
+                    result[path] = digest
+                    self.bytes_hashed += st.st_size
+                    self.record(path, st, digest)
+                    if progress_callback:
+                        progress_callback(done, total)
+            self.flush()
+        return result
+
+    def prune(self):
+        """Remove the entries of files that no longer exist; returns how many were removed."""
+        self.flush()
+        gone = [(path,) for (path,) in self.db.execute("SELECT path FROM digests") if not os.path.exists(path)]
+        with self.db:
+            self.db.executemany("DELETE FROM digests WHERE path = ?", gone)
+        return len(gone)
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM digests").fetchone()[0] + len(self.pending)
+
+
+def format_cache_stats(cache):
+    return f"Digest cache: {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.0%} hit rate)"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kathana persistent file digest cache")
+    parser.add_argument('--cache', default=DIGEST_CACHE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('warm', help="hash every Mesh and Ani file of one or more versions into the cache")
+    p.add_argument('version_paths', nargs='+')
+    p.add_argument('--workers', type=int, default=None)
+    sub.add_parser('prune', help="drop entries of files that no longer exist")
+    sub.add_parser('stats', help="show how many digests are cached")
+    args = parser.parse_args(argv)
+
+    with DigestCache(args.cache) as cache:
+        if args.command == 'warm':
+            from kathana_store import iter_version_assets
+            for version_path in args.version_paths:
+                start = time.time()
+                digests = cache.digests(iter_version_assets(version_path), max_workers=args.workers)
+                logger.info(f"{os.path.basename(version_path)}: {len(digests)} files in {time.time() - start:.1f}s")
+            logger.info(format_cache_stats(cache))
+        elif args.command == 'prune':
+            logger.info(f"Removed {cache.prune()} stale entries")
+        elif args.command == 'stats':
+            logger.info(f"{cache.count()} digests cached in {cache.path}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
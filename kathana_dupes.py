@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from kathana_copy import CopyPlan
+from kathana_digest import DIGEST_SIZE, DigestCache, file_digest
+from kathana_store import STORE_ROOT, ENTITY_TYPES, asset_key, iter_version_assets, remove_file
+from kathana_diff import entity_type_of
+
+logger = logging.getLogger()
+
+DUPLICATES_DIR = os.path.join(STORE_ROOT, "duplicates")
+# Bytes hashed from each end of a file before committing to a full read
+PARTIAL_HASH_SIZE = 64 * 1024
+
+
+@dataclass
+class DuplicateGroup:
+    """Byte-identical assets of one version; the first key is the canonical copy."""
+    size: int
+    digest: str
+    keys: list = field(default_factory=list)
+
+    @property
+    def wasted(self):
+        return self.size * (len(self.keys) - 1)
+
+
+@dataclass
+class ScanStats:
+    files: int = 0
+    size_candidates: int = 0
+    partial_candidates: int = 0
+    bytes_read: int = 0
+
+
+def partial_digest(path, size, chunk_size=PARTIAL_HASH_SIZE):
+    """Hash the head and tail of a file; small files are hashed whole, which is then also their full digest."""
+    if size <= 2 * chunk_size:
+        return file_digest(path)
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as f:
+        digest.update(f.read(chunk_size))
+        f.seek(-chunk_size, os.SEEK_END)
+        digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+def find_duplicates(version_path, entity_types=ENTITY_TYPES, max_workers=8, cache=None):
+    """Group the Mesh and Ani files of a version by identical content.
+
+    Files are narrowed down by size, then by a partial hash of their head and
+    tail, and only the remaining candidates are fully hashed (through the
+    digest cache). Returns (groups sorted by wasted bytes, ScanStats).
+    """
+    stats = ScanStats()
+    by_size = {}
+    for path, st in iter_version_assets(version_path, entity_types):
+        stats.files += 1
+        by_size.setdefault(st.st_size, []).append((path, st))
+    candidates = [asset for assets in by_size.values() if len(assets) > 1 for asset in assets]
+    stats.size_candidates = len(candidates)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partials = list(executor.map(lambda asset: partial_digest(asset[0], asset[1].st_size), candidates))
+    by_partial = {}
+    for (path, st), partial in zip(candidates, partials):
+        stats.bytes_read += min(st.st_size, 2 * PARTIAL_HASH_SIZE)
+        by_partial.setdefault((st.st_size, partial), []).append((path, st))
+
+    groups = []
+    full_hash = []
+    for (size, partial), assets in by_partial.items():
+        if len(assets) < 2:
+            continue
+        if size <= 2 * PARTIAL_HASH_SIZE:
+            # The partial digest already covered the whole file
+            groups.append(DuplicateGroup(size, partial, sorted(asset_key(version_path, path) for path, st in assets)))
+        else:
+            full_hash.extend(assets)
+    stats.partial_candidates = len(full_hash)
+
+    if full_hash:
+        own_cache = cache is None
+        cache = cache or DigestCache()
+        hashed_before = cache.bytes_hashed
+        try:
+            digests = cache.digests(full_hash)
+        finally:
+            if own_cache:
+                cache.close()
+        # Digests served from the cache cost no reads
+        stats.bytes_read += cache.bytes_hashed - hashed_before
+        by_digest = {}
+        for path, st in full_hash:
+            by_digest.setdefault((st.st_size, digests[path]), []).append(asset_key(version_path, path))
+        groups.extend(DuplicateGroup(size, digest, sorted(keys)) for (size, digest), keys in by_digest.items()
+                      if len(keys) > 1)
+
+    groups.sort(key=lambda group: group.wasted, reverse=True)
+    return groups, stats
+
+
+def duplicates_path(version_name, duplicates_dir=DUPLICATES_DIR):
+    return os.path.join(duplicates_dir, f"{version_name}.json")
+
+
+def save_duplicates(version_path, groups, duplicates_dir=DUPLICATES_DIR):
+    os.makedirs(duplicates_dir, exist_ok=True)
+    with open(duplicates_path(os.path.basename(version_path), duplicates_dir), 'w') as f:
+        json.dump({'version': version_path, 'groups': [group.__dict__ for group in groups]}, f, indent=1)
+
+
+def load_duplicates(version_name, duplicates_dir=DUPLICATES_DIR):
+    """Return {asset key: canonical asset key} for every duplicate of the last saved scan, or None."""
+    try:
+        with open(duplicates_path(version_name, duplicates_dir)) as f:
+            groups = json.load(f)['groups']
+    except (OSError, ValueError, KeyError):
+        return None
+    return {key: group['keys'][0] for group in groups for key in group['keys']}
+
+
+def duplicate_names(canonical, entity_type):
+    """Map the lower-case file names of one entity type to their canonical asset key."""
+    return {key.rsplit('/', 1)[-1]: target for key, target in canonical.items() if entity_type_of(key) == entity_type}
+
+
+def dedupe_copy_plan(plan, canonical, version_path):
+    """Copy each distinct content once per plan.
+
+    Returns (plan, links): the plan keeps only the first job of each duplicate
+    group, and links lists (copied dest, dest) pairs to fill in afterwards.
+    """
+    first_dest = {}
+    links = []
+    folders = []
+    for dest_dir, row_jobs in plan.folders:
+        kept = []
+        for job in row_jobs:
+            key = asset_key(version_path, job.src)
+            target = canonical.get(key, key)
+            if target in first_dest:
+                links.append((first_dest[target], job.dest))
+            else:
+                first_dest[target] = job.dest
+                kept.append(job)
+        folders.append((dest_dir, kept))
+    return CopyPlan([job for dest_dir, row_jobs in folders for job in row_jobs], folders), links
+
+
+def link_duplicate_copies(links, log_success=logger.info, log_error=logger.error):
+    """Hard-link each duplicate destination to the copy made for its group, copying if linking fails."""
+    linked = 0
+    for src, dest in links:
+        try:
+            # Replace dest rather than write into it; it may be a read-only link into the store
+            if os.path.lexists(dest):
+                remove_file(dest)
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copyfile(src, dest)
+        except OSError as e:
+            log_error(f"Error linking duplicate {dest}: {e}")
+            continue
+        linked += 1
+        log_success(f"Linked duplicate {dest} to {src}")
+    return linked
+
+
+def format_duplicates(groups, stats):
+    wasted = sum(group.wasted for group in groups)
+    return [f"Scanned {stats.files} files: {stats.size_candidates} share a size, {stats.partial_candidates} needed a "
+            f"full hash, {stats.bytes_read / 1024 ** 2:.1f} MB read",
+            f"{len(groups)} duplicate groups holding {sum(len(group.keys) for group in groups)} files, "
+            f"{wasted / 1024 ** 2:.1f} MB wasted"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find byte-identical Mesh and Ani files within a version")
+    parser.add_argument('version_path')
+    parser.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    parser.add_argument('--list', action='store_true', help="print every duplicate group")
+    parser.add_argument('--no-save', action='store_true', help="do not save the groups for the copy and FBX steps")
+    args = parser.parse_args(argv)
+
+    groups, stats = find_duplicates(args.version_path, args.types)
+    if not args.no_save:
+        save_duplicates(args.version_path, groups)
+    for line in format_duplicates(groups, stats):
+        logger.info(line)
+    if args.list:
+        for group in groups:
+            logger.info(f"{group.wasted / 1024:.0f} KB wasted: {', '.join(group.keys)}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Stand-in for Noesis.exe, for exercising the FBX pipeline on machines without it.
+
+Accepts the same argv contract, ``?cmode <tmb> <out> -loadanimsingle <tab> [flags]``
+(with any number of -loadanimsingle), sleeps for a time proportional to the input
+size, prints -showstats style lines and writes a small text FBX. Behaviour is set
+through environment variables:
+
+  KATHANA_FAKE_NOESIS_BASE      seconds per launch (default 0.05)
+  KATHANA_FAKE_NOESIS_PER_MB    seconds per MB of .tmb and .tab (default 0.5)
+  KATHANA_FAKE_NOESIS_FAIL      fraction of inputs that fail with exit 1 (default 0)
+  KATHANA_FAKE_NOESIS_HANG      fraction of inputs that hang (default 0)
+  KATHANA_FAKE_NOESIS_MATCH     only inputs whose path contains this text fail or hang
+  KATHANA_FAKE_NOESIS_SINGLE    when 1, keep only the last -loadanimsingle, like a build
+                                without multi-animation export
+
+Failures and hangs are chosen by a hash of the input paths, so a retry of the
+same job behaves the same way.
+"""
+import os
+import sys
+import time
+import hashlib
+
+HANG_SECONDS = 24 * 3600
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def parse_argv(argv):
+    """Return (tmb, output, [tab, ...], flags) or raise ValueError."""
+    if len(argv) < 3 or argv[0] != '?cmode':
+        raise ValueError("usage: ?cmode <tmb> <out> -loadanimsingle <tab> [flags]")
+    tmb, output = argv[1], argv[2]
+    tabs = []
+    flags = []
+    rest = iter(argv[3:])
+    for arg in rest:
+        if arg == '-loadanimsingle':
+            tabs.append(next(rest, ''))
+        else:
+            flags.append(arg)
+    return tmb, output, tabs, flags
+
+
+def fraction_of(key):
+    """Deterministic number in [0, 1) for a job."""
+    return int(hashlib.blake2b(key.encode(), digest_size=8).hexdigest(), 16) / 2 ** 64
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        tmb, output, tabs, flags = parse_argv(argv)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 2
+    sizes = {}
+    for path in [tmb] + tabs:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            print(f"ERROR: Could not load {path}")
+            return 2
+
+    key = '|'.join([tmb] + tabs)
+    match = os.environ.get('KATHANA_FAKE_NOESIS_MATCH', '')
+    chosen = fraction_of(key) if match in key else 1.0
+    hang = env_float('KATHANA_FAKE_NOESIS_HANG', 0)
+    fail = env_float('KATHANA_FAKE_NOESIS_FAIL', 0)
+    if os.environ.get('KATHANA_FAKE_NOESIS_SINGLE') == '1':
+        tabs = tabs[-1:]
+    print(f"Detected file type: Kathana TMB ({os.path.basename(tmb)})")
+    sys.stdout.flush()
+    if chosen < hang:
+        time.sleep(HANG_SECONDS)
+    runtime = env_float('KATHANA_FAKE_NOESIS_BASE', 0.05) + \
+        env_float('KATHANA_FAKE_NOESIS_PER_MB', 0.5) * sum(sizes.values()) / 1024 ** 2
+    time.sleep(runtime)
+    if chosen < hang + fail:
+        print(f"ERROR: Failed to apply animation {os.path.basename(tabs[0]) if tabs else ''}")
+        return 1
+
+    # Stable pseudo statistics derived from the input sizes
+    bones = 8 + sizes[tmb] % 57
+    frames = sum(1 + sizes[tab] % 120 for tab in tabs)
+    if '-showstats' in flags:
+        print(f"Bones: {bones}")
+        print(f"Anim frames: {frames}")
+        print(f"Animations: {len(tabs)}")
+    with open(output, 'w') as f:
+        f.write("; FBX 7.4.0 project file\n; Written by the Kathana Noesis stand-in\n")
+        f.write(f"; Mesh: {tmb}\n")
+        for tab in tabs:
+            f.write(f"; Animation: {tab}\n")
+        f.write(f"; Bones: {bones}\n; Frames: {frames}\n; Flags: {' '.join(flags)}\n")
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from kathana_digest import DIGEST_SIZE
+from kathana_store import STORE_ROOT, ENTITY_TYPES
+
+logger = logging.getLogger()
+
+SORTED_ROOT = r"B:\\Kathana-Out\\Sorted"
+FBX_ROOT = r"B:\\Kathana-Out\\FBX"
+# Noesis export flags used by the PySide6 GUI
+NOESIS_FLAGS = ('-fbxnoextraframe',)
+# Animations exported by one Noesis invocation; 1 keeps one process and one FBX per (.tmb, .tab) pair
+NOESIS_ANIMS_PER_JOB = 1
+FBX_STATE_NAME = 'fbx_build.json'
+FBX_CACHE_ROOT = os.path.join(STORE_ROOT, "fbx")
+# File timestamps can trail the system clock by a tick; FAT volumes only keep 2 s resolution
+MTIME_SLACK_NS = 2 * 10 ** 9
+
+
+@dataclass
+class FbxJob:
+    """One Noesis conversion: a mesh, an animation and the FBX it produces."""
+    tmb: str
+    tab: str
+    output: str
+    entity_type: str = ''
+    folder: str = ''
+    # Further animations loaded into the same FBX by the same Noesis invocation
+    extra_tabs: tuple = ()
+
+    @property
+    def tabs(self):
+        return (self.tab, *self.extra_tabs)
+
+
+def fbx_output_path(fbx_root, version_name, entity_type, folder_name, tab_name):
+    """FBX/<version>/<type>/<Folder_Name>/<animation>.fbx, the layout the Sorted walk has always produced."""
+    return os.path.join(fbx_root, version_name, entity_type, folder_name, os.path.splitext(tab_name)[0] + ".fbx")
+
+
+def plan_fbx_from_sorted(version_path, entity_type, sorted_root=SORTED_ROOT, fbx_root=FBX_ROOT):
+    """Pair every .tmb with every .tab of each staged Sorted/<version>/<type>/<Folder> folder.
+
+    Each folder is read with one os.scandir that sorts its entries into meshes,
+    animations and subfolders; the output names of a folder are built once and
+    shared by all of its meshes, without a relpath or existence check per job.
+    """
+    version_name = os.path.basename(version_path)
+    out_root = os.path.join(fbx_root, version_name, entity_type)
+    jobs = []
+    stack = [(os.path.join(sorted_root, version_name, entity_type), '')]
+    while stack:
+        directory, folder_name = stack.pop()
+        meshes = []
+        anims = []
+        subfolders = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subfolders.append((entry.path, os.path.join(folder_name, entry.name) if folder_name else entry.name))
+                    elif entry.name.endswith(".tmb"):
+                        meshes.append(entry.path)
+                    elif entry.name.endswith(".tab"):
+                        anims.append((entry.path, entry.name))
+        except OSError as e:
+            logger.debug(f"Could not scan {directory}: {e}")
+        stack.extend(reversed(subfolders))
+        if not meshes or not anims:
+            continue
+        out_dir = os.path.join(out_root, folder_name) if folder_name else out_root
+        outputs = [(tab_path, os.path.join(out_dir, tab_name[:-4] + ".fbx")) for tab_path, tab_name in anims]
+        for tmb_path in meshes:
+            jobs.extend(FbxJob(tmb_path, tab_path, output, entity_type, folder_name) for tab_path, output in outputs)
+    return jobs
+
+
+def plan_fbx_version(version_path, entity_types=ENTITY_TYPES, sorted_root=SORTED_ROOT, fbx_root=FBX_ROOT):
+    """Plan the conversions of every entity type of a staged version in one pass."""
+    return [job for entity_type in entity_types for job in plan_fbx_from_sorted(version_path, entity_type, sorted_root,
+                                                                                 fbx_root)]
+
+
+def create_output_folders(outputs, max_workers=8):
+    """Create the folder of every output path once; returns the number of folders."""
+    folders = {os.path.dirname(output) for output in outputs}
+    for parent in {os.path.dirname(folder) for folder in folders}:
+        os.makedirs(parent, exist_ok=True)
+
+    def make(folder):
+        try:
+            os.mkdir(folder)
+        except FileExistsError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(make, folders))
+    return len(folders)
+
+
+def plan_fbx_from_copy_plan(plan, version_path, entity_type, fbx_root=FBX_ROOT, log_error=logger.error):
+    """Build the Noesis jobs straight from the entity sheet's copy plan, reading the
+    resource/object/<type>/Mesh and Ani files in place instead of a Sorted copy.
+
+    Each entity pairs every mesh with every animation of its rows, exactly as the
+    Sorted walk pairs the files of a folder.
+    """
+    version_name = os.path.basename(version_path)
+    entities = {}
+    for dest_dir, row_jobs in plan.folders:
+        meshes, anims = entities.setdefault(os.path.basename(dest_dir), ({}, {}))
+        for job in row_jobs:
+            if job.size is None:
+                log_error(f"File not found: {job.src}")
+                continue
+            name = os.path.basename(job.src).lower()
+            if name.endswith(".tmb"):
+                meshes.setdefault(name, job.src)
+            elif name.endswith(".tab"):
+                anims.setdefault(name, job.src)
+
+    jobs = []
+    for folder_name, (meshes, anims) in entities.items():
+        for tmb_path in meshes.values():
+            for tab_path in anims.values():
+                jobs.append(FbxJob(tmb_path, tab_path,
+                                   fbx_output_path(fbx_root, version_name, entity_type, folder_name,
+                                                   os.path.basename(tab_path)),
+                                   entity_type, folder_name))
+    return jobs
+
+
+def group_animations(jobs, anims_per_job=NOESIS_ANIMS_PER_JOB):
+    """Merge the per-pair jobs of each mesh into jobs that export up to anims_per_job animations each.
+
+    A mesh whose animations fit in one job gets FBX/.../<Folder>/<mesh>_anims.fbx;
+    otherwise the chunks are numbered <mesh>_anims01.fbx, <mesh>_anims02.fbx, ...
+    Meshes with a single animation keep their per-pair job. Where several
+    meshes share an animation the last one keeps it, as in the per-pair batch.
+    """
+    if anims_per_job <= 1:
+        return list(jobs)
+    jobs = {job.output: job for job in jobs}.values()
+    meshes = {}
+    for job in jobs:
+        meshes.setdefault((job.tmb, os.path.dirname(job.output)), []).append(job)
+    merged = []
+    for (tmb_path, out_dir), pair_jobs in meshes.items():
+        if len(pair_jobs) == 1:
+            merged.extend(pair_jobs)
+            continue
+        chunks = [pair_jobs[i:i + anims_per_job] for i in range(0, len(pair_jobs), anims_per_job)]
+        stem = os.path.splitext(os.path.basename(tmb_path))[0]
+        for index, chunk in enumerate(chunks, start=1):
+            name = f"{stem}_anims.fbx" if len(chunks) == 1 else f"{stem}_anims{index:02d}.fbx"
+            merged.append(FbxJob(tmb_path, chunk[0].tab, os.path.join(out_dir, name), chunk[0].entity_type,
+                                 chunk[0].folder, tuple(job.tab for job in chunk[1:])))
+    return merged
+
+
+def split_animations(job):
+    """The per-pair jobs a multi-animation job stands for, with their usual <animation>.fbx outputs."""
+    out_dir = os.path.dirname(job.output)
+    return [FbxJob(job.tmb, tab_path, os.path.join(out_dir, os.path.splitext(os.path.basename(tab_path))[0] + ".fbx"),
+                   job.entity_type, job.folder) for tab_path in job.tabs]
+
+
+def noesis_command(job, noesis_exe, flags=NOESIS_FLAGS):
+    """The batch-file line converting one job."""
+    anims = ' '.join(f'-loadanimsingle "{tab_path}"' for tab_path in job.tabs)
+    return f'"{noesis_exe}" ?cmode "{job.tmb}" "{job.output}" {anims} {" ".join(flags)}'
+
+
+class FbxBuildState:
+    """Flags and queue time of every FBX planned under each FBX/<version>/<type> folder.
+
+    A job is up to date when its output exists and is newer than both inputs and
+    than the last time it was queued, and it was queued with the same flags. An
+    output left over from an unfinished batch, a failed run or another flag set
+    is therefore rebuilt.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def _entry(self, output):
+        type_dir = os.path.dirname(os.path.dirname(output))
+        if type_dir not in self.states:
+            try:
+                with open(os.path.join(type_dir, FBX_STATE_NAME)) as f:
+                    self.states[type_dir] = json.load(f)
+            except (OSError, ValueError):
+                self.states[type_dir] = {}
+        return self.states[type_dir], os.path.relpath(output, type_dir).replace('\\', '/').lower()
+
+    def is_current(self, job, flags=NOESIS_FLAGS):
+        state, key = self._entry(job.output)
+        entry = state.get(key)
+        if entry is None or entry[0] != ' '.join(flags):
+            return False
+        try:
+            output_mtime = os.stat(job.output).st_mtime_ns
+            inputs_mtime = max(os.stat(path).st_mtime_ns for path in (job.tmb, *job.tabs))
+        except OSError:
+            return False
+        return output_mtime >= inputs_mtime and output_mtime >= entry[1]
+
+    def mark_queued(self, jobs, flags=NOESIS_FLAGS):
+        queued_at = time.time_ns() - MTIME_SLACK_NS
+        for job in jobs:
+            state, key = self._entry(job.output)
+            state[key] = [' '.join(flags), queued_at]
+
+    def forget(self, jobs):
+        for job in jobs:
+            state, key = self._entry(job.output)
+            state.pop(key, None)
+
+    def save(self):
+        for type_dir, state in self.states.items():
+            os.makedirs(type_dir, exist_ok=True)
+            tmp_path = os.path.join(type_dir, FBX_STATE_NAME + ".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, os.path.join(type_dir, FBX_STATE_NAME))
+
+
+def split_outdated(jobs, state, flags=NOESIS_FLAGS):
+    """Return (jobs to run, jobs whose FBX is up to date)."""
+    outdated = []
+    current = []
+    for job in jobs:
+        (current if state.is_current(job, flags) else outdated).append(job)
+    return outdated, current
+
+
+class FbxCache:
+    """Converted FBX files keyed by the digests of their .tmb and .tab and the Noesis flags.
+
+    Entities that are byte-identical between versions are converted once; later
+    versions get a hard link to the cached FBX (or a copy across volumes).
+    """
+
+    def __init__(self, root=FBX_CACHE_ROOT):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".fbx")
+
+    def keys(self, jobs, digest_cache, flags=NOESIS_FLAGS):
+        """Return {output: cache key} for the jobs whose inputs exist."""
+        assets = {}
+        for job in jobs:
+            for path in (job.tmb, *job.tabs):
+                if path not in assets:
+                    try:
+                        assets[path] = os.stat(path)
+                    except OSError:
+                        pass
+        digests = digest_cache.digests(assets.items())
+        keys = {}
+        for job in jobs:
+            if all(path in digests for path in (job.tmb, *job.tabs)):
+                anims = ':'.join(digests[tab_path] for tab_path in job.tabs)
+                key = hashlib.blake2b(f"{digests[job.tmb]}:{anims}:{' '.join(flags)}".encode(),
+                                      digest_size=DIGEST_SIZE)
+                keys[job.output] = key.hexdigest()
+        return keys
+
+    def fetch(self, jobs, keys):
+        """Link cached FBX files into place and return the jobs that still need Noesis.
+
+        Existing outputs of those jobs are removed as well, so batch files run
+        later never write through a hard link into the cache.
+        """
+        misses = []
+        for job in jobs:
+            key = keys.get(job.output)
+            if key and os.path.exists(self.path(key)):
+                if os.path.lexists(job.output):
+                    os.remove(job.output)
+                try:
+                    os.link(self.path(key), job.output)
+                except OSError:
+                    shutil.copyfile(self.path(key), job.output)
+                # Newer than the queue time recorded by FbxBuildState, so the next run sees it as current
+                os.utime(job.output)
+                self.hits += 1
+            else:
+                if os.path.lexists(job.output):
+                    os.remove(job.output)
+                misses.append(job)
+                self.misses += 1
+        return misses
+
+    def store(self, jobs, keys):
+        """Add finished outputs to the cache unless an entry already exists."""
+        for job in jobs:
+            key = keys.get(job.output)
+            if not key or os.path.exists(self.path(key)) or not os.path.exists(job.output):
+                continue
+            os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+            tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+            shutil.copyfile(job.output, tmp_path)
+            os.replace(tmp_path, self.path(key))
+            self.stored += 1
+
+
+def format_fbx_cache_stats(cache):
+    lookups = cache.hits + cache.misses
+    return (f"FBX cache: {cache.hits} hits, {cache.misses} misses "
+            f"({cache.hits / lookups if lookups else 0:.0%} hit rate), {cache.stored} new entries")
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+
+from kathana_fbx import NOESIS_FLAGS, NOESIS_ANIMS_PER_JOB, FbxJob, plan_fbx_version, create_output_folders, \
+    group_animations
+from kathana_store import ENTITY_TYPES
+from kathana_metrics import load_metrics, fit_cost_model, estimate_job_seconds, input_bytes
+from kathana_noesis import NOESIS_EXE_PATH, NOESIS_WORKERS, NOESIS_RETRIES, noesis_argv, run_noesis_jobs, \
+    format_run_summary, failure_report, format_failure_report, effective_anims_per_job
+
+logger = logging.getLogger()
+
+# Switches such as ?cmode and -loadanimsingle are written bare; paths are always quoted
+SWITCH_ARG = re.compile(r'^[-?][\w-]+$')
+
+
+def job_marker(job, flags=NOESIS_FLAGS):
+    """Stable id of a job, also the name of its done marker; it changes when the inputs, output or flags do."""
+    key = f"{job.tmb}|{'|'.join(job.tabs)}|{job.output}|{' '.join(flags)}".lower()
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def job_costs(jobs):
+    """Estimated seconds per job from the recorded Noesis metrics, or input size when there are none."""
+    model = fit_cost_model(load_metrics())
+    if model is None:
+        return [float(input_bytes(job)) for job in jobs]
+    return [estimate_job_seconds(job, model) for job in jobs]
+
+
+def bat_escape(text):
+    return text.replace('%', '%%')
+
+
+def bat_quote(text):
+    return '"' + bat_escape(text) + '"'
+
+
+def sh_quote(text):
+    return "'" + text.replace("'", "'\\''") + "'"
+
+
+def noesis_spec(job, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, cost=None):
+    """Describe one Noesis conversion: the exact argv, its input and output files and its estimated cost."""
+    return {'id': job_marker(job, flags), 'kind': 'noesis', 'tool': noesis_exe, 'flags': list(flags),
+            'argv': noesis_argv(job, noesis_exe, flags), 'inputs': [job.tmb, *job.tabs], 'outputs': [job.output],
+            'entity_type': job.entity_type, 'folder': job.folder, 'cost': cost}
+
+
+def copy_spec(src, dest):
+    """Describe the copy of a converted FBX to the output of a duplicate pair; it runs after the conversions."""
+    key = f"{src}|{dest}".lower()
+    return {'id': "copy-" + hashlib.blake2b(key.encode(), digest_size=8).hexdigest(), 'kind': 'copy', 'argv': None,
+            'inputs': [src], 'outputs': [dest], 'cost': 0.0}
+
+
+def plan_job_specs(jobs, copies=(), noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, costs=None):
+    """Job specs for the conversions and duplicate copies of a plan, costs defaulting to the metrics model."""
+    jobs = list({job.output: job for job in jobs}.values())
+    costs = job_costs(jobs) if costs is None else costs
+    specs = [noesis_spec(job, noesis_exe, flags, round(cost, 3)) for job, cost in zip(jobs, costs)]
+    specs.extend(copy_spec(src, dest) for src, dest in copies)
+    return specs
+
+
+def save_job_specs(specs, path):
+    """Write the specs as JSON Lines, one job per line."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        for spec in specs:
+            f.write(json.dumps(spec) + '\n')
+    os.replace(tmp_path, path)
+
+
+def load_job_specs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def spec_job(spec):
+    tmb_path, *tab_paths = spec['inputs']
+    return FbxJob(tmb_path, tab_paths[0], spec['outputs'][0], spec.get('entity_type', ''), spec.get('folder', ''),
+                  tuple(tab_paths[1:]))
+
+
+def bat_command(argv):
+    return ' '.join(arg if SWITCH_ARG.match(arg) else bat_quote(arg) for arg in argv)
+
+
+def sh_command(argv):
+    return ' '.join(arg if SWITCH_ARG.match(arg) else sh_quote(arg) for arg in argv)
+
+
+def bat_lines(specs):
+    """The cmd lines of the specs, as the FBX batch files have always been written.
+
+    Each output is deleted before it is written, since it may be a hard link
+    into the FBX cache that Noesis or copy would otherwise write through.
+    """
+    lines = []
+    for spec in specs:
+        lines.extend(f"del /F /Q {bat_quote(output)} 2>nul" for output in spec['outputs'])
+        if spec['kind'] == 'noesis':
+            lines.append(bat_command(spec['argv']))
+        else:
+            lines.append(f"copy /Y {bat_quote(spec['inputs'][0])} {bat_quote(spec['outputs'][0])}")
+    return lines
+
+
+def export_bat(specs, path):
+    with open(path, 'w') as f:
+        for line in bat_lines(specs):
+            f.write(line + '\n')
+
+
+def export_sh(specs, path):
+    with open(path, 'w', newline='\n') as f:
+        f.write("#!/bin/sh\n")
+        for spec in specs:
+            # Unlink first; the output may be a hard link into the FBX cache
+            f.write(f"rm -f {' '.join(sh_quote(output) for output in spec['outputs'])}\n")
+            if spec['kind'] == 'noesis':
+                f.write(sh_command(spec['argv']) + '\n')
+            else:
+                f.write(f"cp -f {sh_quote(spec['inputs'][0])} {sh_quote(spec['outputs'][0])}\n")
+    os.chmod(path, 0o755)
+
+
+# Exporters by file extension
+EXPORTERS = {'.bat': export_bat, '.sh': export_sh}
+
+
+def export_job_specs(specs, path):
+    """Write the specs as a script in the format given by the extension of path."""
+    exporter = EXPORTERS.get(os.path.splitext(path)[1].lower())
+    if exporter is None:
+        raise ValueError(f"No exporter for {path}; expected one of {', '.join(EXPORTERS)}")
+    exporter(specs, path)
+
+
+def run_job_specs(specs, workers=NOESIS_WORKERS, log_success=logger.info, log_error=logger.error,
+                  progress_callback=None, should_stop=None, retries=NOESIS_RETRIES):
+    """Run the specs' argv arrays on the Noesis pool, without a shell, then their copies.
+
+    Returns the JobResult of every conversion that ran.
+    """
+    conversions = [spec for spec in specs if spec['kind'] == 'noesis']
+    copies = [spec for spec in specs if spec['kind'] == 'copy']
+    jobs = [spec_job(spec) for spec in conversions]
+    create_output_folders([job.output for job in jobs] + [spec['outputs'][0] for spec in copies])
+    # Pairs split off a multi-animation job fall back to the tool and flags of their spec
+    tool = conversions[0].get('tool', NOESIS_EXE_PATH) if conversions else NOESIS_EXE_PATH
+    flags = tuple(conversions[0].get('flags', NOESIS_FLAGS)) if conversions else NOESIS_FLAGS
+    results = run_noesis_jobs(jobs, tool, flags, workers, log_success, log_error, progress_callback, should_stop,
+                              retries, argvs={job.output: spec['argv'] for job, spec in zip(jobs, conversions)})
+    converted = {result.job.output for result in results if result.ok}
+    for spec in copies:
+        src, dest = spec['inputs'][0], spec['outputs'][0]
+        if should_stop and should_stop():
+            break
+        if src in converted or os.path.exists(src):
+            # Replace rather than overwrite, in case dest is a hard link into the FBX cache
+            if os.path.lexists(dest):
+                os.remove(dest)
+            shutil.copyfile(src, dest)
+            log_success(f"Copied {src} to {dest}")
+        else:
+            log_error(f"Not copying {dest}: {src} was not converted")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan, export and run FBX conversion job specs (JSON Lines)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('plan', help="write the job specs of a staged version")
+    p.add_argument('version_path')
+    p.add_argument('out', help="JSON Lines file to write")
+    p.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    p.add_argument('--noesis', default=NOESIS_EXE_PATH)
+    p.add_argument('--anims-per-job', type=int, default=NOESIS_ANIMS_PER_JOB)
+
+    p = sub.add_parser('export', help="write job specs as .bat or .sh scripts")
+    p.add_argument('specs')
+    p.add_argument('scripts', nargs='+', help="output scripts; the extension picks the format")
+
+    p = sub.add_parser('run', help="run job specs on a pool of Noesis processes")
+    p.add_argument('specs')
+    p.add_argument('--workers', type=int, default=NOESIS_WORKERS)
+    p.add_argument('--retries', type=int, default=NOESIS_RETRIES)
+    p.add_argument('--report', help="write the failing inputs to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'plan':
+        jobs = group_animations(plan_fbx_version(args.version_path, args.types),
+                                effective_anims_per_job(args.anims_per_job, args.noesis))
+        specs = plan_job_specs(jobs, noesis_exe=args.noesis)
+        save_job_specs(specs, args.out)
+        logger.info(f"Wrote {len(specs)} job specs to {args.out}")
+    elif args.command == 'export':
+        specs = load_job_specs(args.specs)
+        for path in args.scripts:
+            export_job_specs(specs, path)
+            logger.info(f"Wrote {len(specs)} jobs to {path}")
+    else:
+        start = time.time()
+        results = run_job_specs(load_job_specs(args.specs), args.workers, log_success=logger.debug,
+                                retries=args.retries)
+        logger.info(format_run_summary(results, time.time() - start))
+        report = failure_report(results)
+        for line in format_failure_report(report):
+            logger.info(line)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=1)
+        return 1 if report else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
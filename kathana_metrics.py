@@ -0,0 +1,169 @@
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger()
+
+NOESIS_METRICS_PATH = os.path.join(os.getcwd(), "KATHANA_NOESIS_METRICS.jsonl")
+# Noesis -showstats prints "Name: count" lines, e.g. "Bones: 54" or "Anim frames: 31"
+STAT_LINE = re.compile(r'^\s*([A-Za-z][A-Za-z _/-]*?)\s*[:=]\s*(\d+)\s*$')
+
+
+@dataclass
+class JobMetrics:
+    """What one Noesis conversion cost and what it produced."""
+    tmb: str
+    tab: str
+    output: str
+    entity_type: str = ''
+    folder: str = ''
+    seconds: float = 0.0
+    returncode: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    bones: int = None
+    frames: int = None
+    stats: dict = field(default_factory=dict)
+    finished_at: float = 0.0
+    animations: int = 1
+    # 'timeout' or 'stopped' when the watchdog killed Noesis
+    killed: str = None
+
+
+def parse_stat_line(line, stats):
+    """Add a "Name: count" line of -showstats output to stats; returns True if it was one."""
+    match = STAT_LINE.match(line)
+    if not match:
+        return False
+    key = match.group(1).strip().lower()
+    # Multi-model files repeat the block; keep the totals
+    stats[key] = stats.get(key, 0) + int(match.group(2))
+    return True
+
+
+def animation_count(stats):
+    """Animations Noesis reported exporting, or None when -showstats did not say."""
+    return next((value for key, value in stats.items() if key.startswith('anim') and 'frame' not in key), None)
+
+
+def input_bytes(job):
+    return file_size(job.tmb) + sum(file_size(tab_path) for tab_path in job.tabs)
+
+
+def bones_and_frames(stats):
+    bones = next((value for key, value in stats.items() if 'bone' in key), None)
+    frames = next((value for key, value in stats.items() if 'frame' in key), None)
+    return bones, frames
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def job_metrics(result):
+    """Build the metrics of a finished JobResult."""
+    job = result.job
+    bones, frames = bones_and_frames(result.stats)
+    return JobMetrics(job.tmb, job.tab, job.output, job.entity_type, job.folder, round(result.seconds, 3),
+                      result.returncode, input_bytes(job), file_size(job.output) if result.ok else 0, bones, frames,
+                      result.stats, time.time(), len(job.tabs), result.killed)
+
+
+def record_metrics(metrics, path=NOESIS_METRICS_PATH):
+    """Append metrics to the history, one JSON object per line."""
+    with open(path, 'a') as f:
+        for entry in metrics:
+            f.write(json.dumps(asdict(entry)) + '\n')
+
+
+def load_metrics(path=NOESIS_METRICS_PATH):
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def fit_cost_model(records):
+    """Fit seconds = per_byte * input bytes + overhead over successful conversions.
+
+    Returns (per_byte, overhead), or None without any history.
+    """
+    points = [(record['input_bytes'], record['seconds']) for record in records if record['returncode'] == 0]
+    if not points:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, y in points) / n
+    mean_y = sum(y for x, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, y in points)
+    if sxx > 0:
+        per_byte = sum((x - mean_x) * (y - mean_y) for x, y in points) / sxx
+        overhead = mean_y - per_byte * mean_x
+        if per_byte >= 0 and overhead >= 0:
+            return per_byte, overhead
+    return 0.0, mean_y
+
+
+def estimate_job_seconds(job, model):
+    """Predicted runtime of a job; 1 per job when there is no history, so costs stay comparable."""
+    if model is None:
+        return 1.0
+    per_byte, overhead = model
+    return per_byte * input_bytes(job) + overhead
+
+
+def predict_run_seconds(costs, workers):
+    """Makespan of running jobs with the given costs largest-first on a pool of workers."""
+    slots = [0.0] * max(1, workers)
+    for cost in sorted(costs, reverse=True):
+        heapq.heapreplace(slots, slots[0] + cost)
+    return max(slots)
+
+
+def slowest_entities(records, count=10):
+    """Return [(seconds, entity type, folder, conversions)] of the entities that took longest to convert."""
+    totals = {}
+    for record in records:
+        key = (record['entity_type'], record['folder'])
+        seconds, jobs = totals.get(key, (0.0, 0))
+        totals[key] = (seconds + record['seconds'], jobs + 1)
+    ranked = sorted(((seconds, entity_type, folder, jobs) for (entity_type, folder), (seconds, jobs) in totals.items()),
+                    reverse=True)
+    return ranked[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report on recorded Noesis conversion metrics")
+    parser.add_argument('--metrics', default=NOESIS_METRICS_PATH)
+    parser.add_argument('--top', type=int, default=20, help="number of slowest entities to list")
+    args = parser.parse_args(argv)
+
+    records = load_metrics(args.metrics)
+    if not records:
+        logger.info(f"No metrics recorded in {args.metrics}")
+        return
+    model = fit_cost_model(records)
+    logger.info(f"{len(records)} conversions recorded; model: {model[0] * 1024 ** 2:.2f} s per MB "
+                f"+ {model[1]:.2f} s per launch")
+    for seconds, entity_type, folder, jobs in slowest_entities(records, args.top):
+        logger.info(f"{seconds:>9.1f}s  {entity_type}/{folder} ({jobs} conversions)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from kathana_fbx import NOESIS_FLAGS, NOESIS_ANIMS_PER_JOB, FbxJob, plan_fbx_version, create_output_folders, \
+    group_animations, split_animations
+from kathana_store import ENTITY_TYPES
+from kathana_metrics import NOESIS_METRICS_PATH, parse_stat_line, job_metrics, record_metrics, load_metrics, \
+    fit_cost_model, estimate_job_seconds, predict_run_seconds, animation_count, input_bytes
+
+logger = logging.getLogger()
+
+NOESIS_EXE_PATH = r"B:\\Kathana\\_Noesis\\Noesis.exe"
+NOESIS_WORKERS = os.cpu_count() or 4
+# Keep a console window from flashing up for every conversion on Windows
+NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+# A conversion may run NOESIS_TIMEOUT_BASE seconds plus NOESIS_TIMEOUT_PER_MB per MB of .tmb and .tab
+NOESIS_TIMEOUT_BASE = 60
+NOESIS_TIMEOUT_PER_MB = 30
+# Failed or hung jobs are retried after NOESIS_BACKOFF, 2 * NOESIS_BACKOFF, ... seconds
+NOESIS_RETRIES = 2
+NOESIS_BACKOFF = 5.0
+# Printed statistics only; not part of the flag set that decides whether an FBX is up to date
+SHOWSTATS_FLAG = '-showstats'
+# Noesis builds seen keeping only one -loadanimsingle per run: {executable path: [size, mtime_ns]}
+NOESIS_CAPS_PATH = os.path.join(os.getcwd(), "KATHANA_NOESIS_CAPS.json")
+
+
+@dataclass
+class JobResult:
+    """Exit code, combined stdout/stderr and runtime of one Noesis conversion."""
+    job: FbxJob
+    returncode: int
+    output: str = ''
+    seconds: float = 0.0
+    # 'timeout' or 'stopped' when the watchdog killed the process
+    killed: str = None
+    attempts: int = 1
+    # "Name: count" lines of the -showstats output
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and self.killed is None
+
+
+def kill_process_tree(proc):
+    """Kill a conversion and anything it started, so nothing keeps its output pipe open."""
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(proc.pid)], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, creationflags=NO_WINDOW)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+class NoesisWatchdog:
+    """Kills Noesis processes that run past their deadline, and every running one once should_stop() turns true."""
+
+    def __init__(self, should_stop=None, interval=0.5):
+        self.should_stop = should_stop
+        self.interval = interval
+        self.deadlines = {}
+        self.killed = {}
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+
+    def watch(self, proc, timeout):
+        with self.lock:
+            self.deadlines[proc] = time.monotonic() + timeout if timeout else float('inf')
+
+    def release(self, proc):
+        """Stop watching a finished process; returns why it was killed, or None."""
+        with self.lock:
+            self.deadlines.pop(proc, None)
+            return self.killed.pop(proc, None)
+
+    def _watch(self):
+        while not self.done.wait(self.interval):
+            stopping = bool(self.should_stop and self.should_stop())
+            now = time.monotonic()
+            with self.lock:
+                for proc, deadline in list(self.deadlines.items()):
+                    if proc in self.killed or not (stopping or now > deadline):
+                        continue
+                    self.killed[proc] = 'stopped' if stopping else 'timeout'
+                    kill_process_tree(proc)
+
+
+def job_timeout(job):
+    """Seconds a conversion may take, scaled to the size of its inputs."""
+    return NOESIS_TIMEOUT_BASE + NOESIS_TIMEOUT_PER_MB * input_bytes(job) / 1024 ** 2
+
+
+def noesis_argv(job, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, showstats=True):
+    argv = [noesis_exe, '?cmode', job.tmb, job.output]
+    for tab_path in job.tabs:
+        argv.extend(('-loadanimsingle', tab_path))
+    argv.extend(flags)
+    if noesis_exe.endswith('.py'):
+        # A Python stand-in such as kathana_fake_noesis.py; Windows cannot launch scripts directly
+        argv.insert(0, sys.executable)
+    if showstats and SHOWSTATS_FLAG not in flags:
+        argv.append(SHOWSTATS_FLAG)
+    return argv
+
+
+def run_noesis_job(job, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, timeout=None, watchdog=None, argv=None):
+    """Run one conversion without a shell, streaming its output into -showstats metrics.
+
+    argv replaces the command built from the job, e.g. one read from a job
+    spec. An existing output is removed before Noesis starts. The process is
+    killed by the watchdog once timeout seconds pass; without one a private
+    watchdog is used.
+    """
+    if watchdog is None:
+        with NoesisWatchdog() as watchdog:
+            return run_noesis_job(job, noesis_exe, flags, timeout, watchdog, argv)
+    start = time.time()
+    try:
+        # The old output may be a hard link into the FBX cache; Noesis must write a new file, not through it
+        if os.path.lexists(job.output):
+            os.remove(job.output)
+        proc = subprocess.Popen(argv or noesis_argv(job, noesis_exe, flags), stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, text=True, errors='replace',
+                                creationflags=NO_WINDOW, start_new_session=os.name != 'nt')
+    except OSError as e:
+        return JobResult(job, -1, str(e), time.time() - start)
+    watchdog.watch(proc, timeout)
+    lines = []
+    stats = {}
+    with proc.stdout:
+        for line in proc.stdout:
+            lines.append(line)
+            parse_stat_line(line, stats)
+    proc.wait()
+    killed = watchdog.release(proc)
+    return JobResult(job, proc.returncode, ''.join(lines), time.time() - start, killed, stats=stats)
+
+
+def run_with_retries(job, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, watchdog=None, retries=NOESIS_RETRIES,
+                     backoff=NOESIS_BACKOFF, should_stop=None, argv=None):
+    """Run a conversion, retrying failures and timeouts with exponential backoff."""
+    timeout = job_timeout(job)
+    for attempt in range(retries + 1):
+        result = run_noesis_job(job, noesis_exe, flags, timeout, watchdog, argv)
+        result.attempts = attempt + 1
+        if result.ok or result.killed == 'stopped' or (should_stop and should_stop()):
+            break
+        if attempt < retries:
+            logger.warning(f"Retrying {job.output} after {'a timeout' if result.killed else f'exit {result.returncode}'}")
+            time.sleep(backoff * 2 ** attempt)
+    return result
+
+
+def log_result(result, log_success=logger.info, log_error=logger.error):
+    if result.ok:
+        log_success(f"Converted {result.job.output} in {result.seconds:.1f}s")
+    elif result.killed:
+        log_error(f"Noesis {'timed out' if result.killed == 'timeout' else 'was stopped'} on "
+                  f"{result.job.output} after {result.attempts} attempts")
+    else:
+        log_error(f"Noesis exited with {result.returncode} for {result.job.output} after "
+                  f"{result.attempts} attempts: {result.output.strip()[-500:]}")
+
+
+def _exe_key(noesis_exe):
+    return os.path.normcase(os.path.abspath(noesis_exe))
+
+
+def _exe_version(noesis_exe):
+    try:
+        st = os.stat(noesis_exe)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_noesis_caps(path=NOESIS_CAPS_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def single_animation_only(noesis_exe=NOESIS_EXE_PATH, path=NOESIS_CAPS_PATH):
+    """True if this build of Noesis was seen dropping all but one -loadanimsingle; a new build is tried afresh."""
+    version = _exe_version(noesis_exe)
+    return version is not None and load_noesis_caps(path).get(_exe_key(noesis_exe)) == version
+
+
+def remember_single_animation(noesis_exe=NOESIS_EXE_PATH, path=NOESIS_CAPS_PATH):
+    caps = load_noesis_caps(path)
+    caps[_exe_key(noesis_exe)] = _exe_version(noesis_exe)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(caps, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def effective_anims_per_job(anims_per_job, noesis_exe=NOESIS_EXE_PATH):
+    """anims_per_job, or 1 once this Noesis build is known to export a single animation per run."""
+    if anims_per_job > 1 and single_animation_only(noesis_exe):
+        logger.info(f"{noesis_exe} exports one animation per run; planning one job per mesh/animation pair")
+        return 1
+    return anims_per_job
+
+
+def exported_all_animations(result):
+    """Whether a conversion succeeded and, where -showstats says, kept every animation it was given."""
+    count = animation_count(result.stats)
+    return result.ok and (count is None or count >= len(result.job.tabs))
+
+
+def run_noesis_jobs(jobs, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS, workers=NOESIS_WORKERS,
+                    log_success=logger.info, log_error=logger.error, progress_callback=None, should_stop=None,
+                    retries=NOESIS_RETRIES, backoff=NOESIS_BACKOFF, metrics_path=NOESIS_METRICS_PATH, argvs=None,
+                    build_state=None, caps_path=NOESIS_CAPS_PATH):
+    """Run conversions on a pool of concurrent Noesis processes.
+
+    Each job gets a timeout scaled to its input size; a watchdog kills hung
+    processes, and failed jobs are retried with backoff, so one bad asset only
+    costs its own slot. A multi-animation job that fails, or that -showstats
+    shows dropped animations, is replaced by its per-pair jobs; once Noesis
+    drops animations, the remaining multi-animation jobs are split before they
+    start. progress_callback(completed, total, result) is called as each job
+    ends; when should_stop() turns true, running processes are killed and jobs
+    not yet started are skipped. The metrics of every job that ran are
+    appended to metrics_path. argvs maps outputs to the exact command to
+    run instead of the one built from the job. With a build_state, a replaced
+    job's entry is moved to its per-pair outputs. A Noesis build found
+    keeping one animation per run is remembered in caps_path, so later plans
+    stay per-pair.
+    Returns the JobResult of every job that ran, without the multi-animation
+    jobs that were replaced.
+    """
+    argvs = argvs or {}
+    # Several meshes of a folder share an animation's output name; a sequential batch leaves the
+    # last one's FBX, and running them concurrently would interleave writes to one file
+    jobs = list({job.output: job for job in jobs}.values())
+    total = len(jobs)
+    completed = 0
+    results = []
+    ran = []
+    # Set once Noesis has shown it only keeps one -loadanimsingle per invocation
+    single_only = threading.Event()
+
+    def run(job):
+        if (should_stop and should_stop()) or (job.extra_tabs and single_only.is_set()):
+            return job, None
+        argv = argvs.get(job.output)
+        if not job.extra_tabs:
+            return job, run_with_retries(job, noesis_exe, flags, watchdog, retries, backoff, should_stop, argv)
+        # A failing multi-animation export falls back to per-pair jobs rather than being retried whole
+        result = run_with_retries(job, noesis_exe, flags, watchdog, 0, backoff, should_stop, argv)
+        if result.ok and not exported_all_animations(result):
+            single_only.set()
+        return job, result
+
+    with NoesisWatchdog(should_stop) as watchdog, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(run, job) for job in jobs}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, result = future.result()
+                if result is not None:
+                    ran.append(result)
+                stopping = should_stop and should_stop()
+                if job.extra_tabs and not stopping and (result is None or not exported_all_animations(result)):
+                    pairs = split_animations(job)
+                    if os.path.exists(job.output):
+                        os.remove(job.output)
+                    if build_state is not None:
+                        build_state.forget([job])
+                        build_state.mark_queued(pairs, flags)
+                    logger.info(f"Converting the {len(pairs)} animations of {job.output} one at a time")
+                    total += len(pairs) - 1
+                    pending.update(executor.submit(run, pair) for pair in pairs)
+                    continue
+                completed += 1
+                if result is not None:
+                    results.append(result)
+                    log_result(result, log_success, log_error)
+                if progress_callback:
+                    progress_callback(completed, total, result)
+    if metrics_path and ran:
+        record_metrics([job_metrics(result) for result in ran], metrics_path)
+    if caps_path and single_only.is_set():
+        remember_single_animation(noesis_exe, caps_path)
+    return results
+
+
+def format_run_summary(results, seconds):
+    failed = sum(not result.ok for result in results)
+    busy = sum(result.seconds for result in results)
+    return (f"{len(results) - failed} conversions succeeded, {failed} failed in {seconds:.1f}s "
+            f"({busy / seconds if seconds else 0:.1f} processes busy on average)")
+
+
+def failure_report(results):
+    """The inputs of every job that still failed after its retries."""
+    return [{'tmb': result.job.tmb, 'tab': result.job.tab, 'output': result.job.output,
+             'returncode': result.returncode, 'killed': result.killed, 'attempts': result.attempts,
+             'log': result.output.strip()[-2000:]} for result in results if not result.ok]
+
+
+def format_failure_report(report):
+    lines = [f"{len(report)} conversions failed:"] if report else []
+    for entry in report:
+        reason = 'timed out' if entry['killed'] == 'timeout' else entry['killed'] or f"exit {entry['returncode']}"
+        lines.append(f"  {reason}: {entry['tmb']} + {entry['tab']}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert staged Sorted folders to FBX on a pool of Noesis processes")
+    parser.add_argument('version_path')
+    parser.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    parser.add_argument('--workers', type=int, default=NOESIS_WORKERS)
+    parser.add_argument('--noesis', default=NOESIS_EXE_PATH)
+    parser.add_argument('--retries', type=int, default=NOESIS_RETRIES)
+    parser.add_argument('--report', help="write the failing inputs to this JSON file")
+    parser.add_argument('--anims-per-job', type=int, default=NOESIS_ANIMS_PER_JOB,
+                        help="animations exported by one Noesis run (1: one run per mesh/animation pair)")
+    args = parser.parse_args(argv)
+
+    jobs = group_animations(plan_fbx_version(args.version_path, args.types),
+                            effective_anims_per_job(args.anims_per_job, args.noesis))
+    create_output_folders(job.output for job in jobs)
+    model = fit_cost_model(load_metrics())
+    costs = {job.output: estimate_job_seconds(job, model) for job in jobs}
+    total_cost = sum(costs.values()) or 1
+    if model:
+        logger.info(f"Predicted runtime: {predict_run_seconds(costs.values(), args.workers):.0f}s")
+    failed = 0
+    done_cost = 0.0
+
+    def report_progress(completed, total, result):
+        nonlocal failed, done_cost
+        if result is not None:
+            failed += not result.ok
+            done_cost += costs.get(result.job.output, 0.0)
+        sys.stderr.write(f"\r{completed}/{total} converted ({done_cost / total_cost:.0%} of the work), {failed} failed")
+        sys.stderr.flush()
+
+    start = time.time()
+    results = run_noesis_jobs(jobs, args.noesis, workers=args.workers, log_success=logger.debug,
+                              progress_callback=report_progress, retries=args.retries)
+    sys.stderr.write("\n")
+    logger.info(format_run_summary(results, time.time() - start))
+    report = failure_report(results)
+    for line in format_failure_report(report):
+        logger.info(line)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
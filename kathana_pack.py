@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+import tarfile
+import argparse
+
+from kathana_copy import COPY_CHUNK_SIZE, DevicePools
+
+logger = logging.getLogger()
+
+# Packed output keeps one uncompressed tar per entity next to a per-type index
+PACK_SUFFIX = '.tar'
+PACK_INDEX_NAME = 'pack_index.json'
+
+
+class ThrottledReader:
+    """Read-only file wrapper that charges every chunk read to a byte limiter."""
+
+    def __init__(self, f, wait_bytes):
+        self.f = f
+        self.wait_bytes = wait_bytes
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        if data:
+            self.wait_bytes(len(data))
+        return data
+
+
+def write_entity_archive(archive_path, sources, throttle=None, loop=None):
+    """Stream the source files into one uncompressed tar, without temporary files.
+
+    Runs in a worker thread; with a throttle, every file and every chunk waits
+    for its tokens on the event loop before it is written. Returns
+    {member name: [data offset, size]} for the files that were packed and the
+    list of sources that could not be read.
+    """
+    def wait(bucket, amount):
+        asyncio.run_coroutine_threadsafe(bucket.acquire(amount), loop).result()
+
+    members = {}
+    missing = []
+    with tarfile.open(archive_path, 'w', format=tarfile.GNU_FORMAT) as tar:
+        tar.copybufsize = COPY_CHUNK_SIZE
+        for src in sources:
+            name = os.path.basename(src)
+            try:
+                info = tar.gettarinfo(src, arcname=name)
+                with open(src, 'rb') as f:
+                    reader = f
+                    if throttle:
+                        wait(throttle.files_bucket, 1)
+                        reader = ThrottledReader(f, lambda amount: wait(throttle.bytes_bucket, amount))
+                    header_offset = tar.offset
+                    tar.addfile(info, reader)
+            except OSError:
+                missing.append(src)
+                continue
+            header_size = len(info.tobuf(tar.format, tar.encoding, tar.errors))
+            members[name] = [header_offset + header_size, info.size]
+    return members, missing
+
+
+def load_pack_index(type_dir):
+    """Load the index of a packed entity-type folder, or {} if there is none."""
+    try:
+        with open(os.path.join(type_dir, PACK_INDEX_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_pack_index(type_dir, index):
+    """Merge entries into the index of a packed entity-type folder."""
+    merged = load_pack_index(type_dir)
+    merged.update(index)
+    with open(os.path.join(type_dir, PACK_INDEX_NAME), 'w') as f:
+        json.dump(merged, f, indent=1, sort_keys=True)
+
+
+def read_member(type_dir, folder_name, member, index=None):
+    """Return the bytes of one file inside an entity archive, using the index for a single seek."""
+    index = index if index is not None else load_pack_index(type_dir)
+    archive_path = os.path.join(type_dir, folder_name + PACK_SUFFIX)
+    entry = index.get(folder_name, {}).get('members', {}).get(member)
+    if entry is None:
+        with tarfile.open(archive_path) as tar:
+            return tar.extractfile(member).read()
+    offset, size = entry
+    with open(archive_path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _copy_range(src, dest_path, offset, size):
+    src.seek(offset)
+    with open(dest_path, 'wb') as dest:
+        while size > 0:
+            chunk = src.read(min(size, 1024 * 1024))
+            if not chunk:
+                raise EOFError(f"Archive ended early while extracting {dest_path}")
+            dest.write(chunk)
+            size -= len(chunk)
+
+
+def extract_entity_archive(type_dir, folder_name, dest_dir, index=None):
+    """Extract one entity archive into dest_dir/<folder_name>; returns the number of files written."""
+    index = index if index is not None else load_pack_index(type_dir)
+    archive_path = os.path.join(type_dir, folder_name + PACK_SUFFIX)
+    out_dir = os.path.join(dest_dir, folder_name)
+    os.makedirs(out_dir, exist_ok=True)
+    members = index.get(folder_name, {}).get('members')
+    if members is None:
+        # No index entry: fall back to walking the tar headers
+        with tarfile.open(archive_path) as tar:
+            members = {info.name: [info.offset_data, info.size] for info in tar if info.isfile()}
+    with open(archive_path, 'rb') as src:
+        for name, (offset, size) in sorted(members.items(), key=lambda item: item[1][0]):
+            _copy_range(src, os.path.join(out_dir, os.path.basename(name)), offset, size)
+    return len(members)
+
+
+def extract_all(type_dir, dest_dir):
+    """Extract every entity archive of a packed entity-type folder."""
+    index = load_pack_index(type_dir)
+    folders = sorted(name[:-len(PACK_SUFFIX)] for name in os.listdir(type_dir) if name.endswith(PACK_SUFFIX))
+    return sum(extract_entity_archive(type_dir, folder, dest_dir, index) for folder in folders)
+
+
+async def run_pack_jobs(plan, pools=None, throttle=None, log_success=logger.info, log_error=logger.error,
+                        progress_callback=None, should_stop=None):
+    """Pack each entity of a copy plan into <type folder>/<Folder_Name>.tar and update the index.
+
+    Entities are packed in parallel, limited by the same per-device pools as plain copies.
+    """
+    pools = pools or DevicePools()
+    entities = {}
+    for dest_dir, row_jobs in plan.folders:
+        if row_jobs:
+            entities.setdefault(dest_dir, []).extend(row_jobs)
+        else:
+            log_error(f"Skipped empty directory: {dest_dir}")
+    for type_dir in {os.path.dirname(dest_dir) for dest_dir in entities}:
+        os.makedirs(type_dir, exist_ok=True)
+
+    total = len(entities)
+    completed = 0
+    indexes = {}
+
+    async def pack_entity(dest_dir, jobs):
+        nonlocal completed
+        archive_path = dest_dir + PACK_SUFFIX
+        async with pools.hold(jobs[0]):
+            if should_stop and should_stop():
+                return
+            try:
+                members, missing = await asyncio.to_thread(write_entity_archive, archive_path,
+                                                           [job.src for job in jobs], throttle,
+                                                           asyncio.get_running_loop())
+            except Exception as e:
+                log_error(f"Error packing {archive_path}: {e}")
+                return
+        for src in missing:
+            log_error(f"File not found: {src}")
+        if throttle:
+            throttle.files_copied += len(members)
+            throttle.bytes_copied += sum(size for offset, size in members.values())
+        type_dir, folder_name = os.path.split(dest_dir)
+        indexes.setdefault(type_dir, {})[folder_name] = {'archive': folder_name + PACK_SUFFIX, 'members': members}
+        log_success(f"Packed {len(members)} files into {archive_path}")
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, total)
+
+    await asyncio.gather(*(pack_entity(dest_dir, jobs) for dest_dir, jobs in entities.items()))
+    for type_dir, index in indexes.items():
+        save_pack_index(type_dir, index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and extract packed Kathana entity archives")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('list', help="list the entities and members of a packed type folder")
+    p.add_argument('type_dir')
+    p = sub.add_parser('extract', help="extract every entity archive, or one with --entity")
+    p.add_argument('type_dir')
+    p.add_argument('dest_dir')
+    p.add_argument('--entity')
+    p = sub.add_parser('cat', help="write one member of an entity archive to stdout")
+    p.add_argument('type_dir')
+    p.add_argument('entity')
+    p.add_argument('member')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for folder_name, entry in sorted(load_pack_index(args.type_dir).items()):
+            print(f"{folder_name}: {', '.join(sorted(entry['members']))}")
+    elif args.command == 'extract':
+        if args.entity:
+            count = extract_entity_archive(args.type_dir, args.entity, args.dest_dir)
+        else:
+            count = extract_all(args.type_dir, args.dest_dir)
+        print(f"Extracted {count} files to {args.dest_dir}")
+    elif args.command == 'cat':
+        sys.stdout.buffer.write(read_member(args.type_dir, args.entity, args.member))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
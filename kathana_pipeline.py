@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import openpyxl
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from kathana_copy import SORTED_ROOT, DEVICE_BUDGETS, DevicePools, plan_entity_copies, create_destination_folders, \
+    run_copy_jobs
+from kathana_fbx import FBX_ROOT, NOESIS_FLAGS, FbxJob, FbxBuildState, fbx_output_path, split_outdated
+from kathana_metrics import NOESIS_METRICS_PATH, job_metrics, record_metrics
+from kathana_noesis import NOESIS_EXE_PATH, NOESIS_WORKERS, NOESIS_RETRIES, NOESIS_BACKOFF, NoesisWatchdog, \
+    run_with_retries, log_result, format_run_summary, format_failure_report, failure_report
+from kathana_store import ENTITY_TYPES
+
+logger = logging.getLogger()
+
+# Seconds between saves of the FBX build state while entities are being queued
+STATE_SAVE_INTERVAL = 5.0
+
+
+@dataclass
+class PipelineStats:
+    """Outcome of a copy-to-convert run; times are seconds since the run started."""
+    copied: int = 0
+    copy_failed: int = 0
+    entities: int = 0
+    up_to_date: int = 0
+    results: list = field(default_factory=list)
+    first_conversion_at: float = None
+    copies_done_at: float = 0.0
+    seconds: float = 0.0
+
+    @property
+    def overlap(self):
+        """Seconds during which copies and conversions ran at the same time."""
+        if self.first_conversion_at is None:
+            return 0.0
+        return max(0.0, self.copies_done_at - self.first_conversion_at)
+
+
+def entity_conversions(dest_dir, copied, version_name, entity_type, fbx_root=FBX_ROOT):
+    """Pair every copied .tmb of an entity folder with every copied .tab, as the Sorted walk does.
+
+    Meshes sharing an animation write the same FBX; the last one wins, like
+    the sequential batch.
+    """
+    folder_name = os.path.basename(dest_dir)
+    meshes = [path for path in copied if path.lower().endswith(".tmb")]
+    anims = [path for path in copied if path.lower().endswith(".tab")]
+    jobs = {}
+    for tmb_path in meshes:
+        for tab_path in anims:
+            output = fbx_output_path(fbx_root, version_name, entity_type, folder_name, os.path.basename(tab_path))
+            jobs[output] = FbxJob(tmb_path, tab_path, output, entity_type, folder_name)
+    return list(jobs.values())
+
+
+def expected_conversions(row_jobs):
+    """Conversions an entity will need if all of its sources copy."""
+    names = {os.path.basename(job.dest).lower() for job in row_jobs if job.size is not None}
+    if not any(name.endswith(".tmb") for name in names):
+        return 0
+    return sum(name.endswith(".tab") for name in names)
+
+
+async def run_copy_convert_pipeline(plans, version_path, noesis_exe=NOESIS_EXE_PATH, flags=NOESIS_FLAGS,
+                                    noesis_workers=NOESIS_WORKERS, pools=None, throttle=None, fbx_root=FBX_ROOT,
+                                    build_state=None, rebuild=False, log_success=logger.info, log_error=logger.error,
+                                    progress_callback=None, should_stop=None, retries=NOESIS_RETRIES,
+                                    backoff=NOESIS_BACKOFF, metrics_path=NOESIS_METRICS_PATH):
+    """Copy the (entity type, CopyPlan) pairs and convert each entity folder as soon as its own copies end.
+
+    Copies run entity by entity under the per-device budgets of pools and are
+    kept in the page cache for Noesis; conversions run on their own pool of
+    noesis_workers processes, so copy I/O and Noesis CPU work overlap. With a
+    build_state, FBX files that are up to date are skipped unless rebuild is set.
+    progress_callback(completed, total) counts copies plus conversions.
+    """
+    start = time.monotonic()
+    version_name = os.path.basename(version_path)
+    stats = PipelineStats()
+    lock = threading.Lock()
+    # Destination folder -> [entity type, copies still running, copied files, expected conversions]
+    entities = {}
+    entity_jobs = {}
+    copy_jobs = []
+    for entity_type, plan in plans:
+        for dest_dir, row_jobs in plan.folders:
+            if not row_jobs:
+                continue
+            entities.setdefault(dest_dir, [entity_type, 0, [], 0])[1] += len(row_jobs)
+            entity_jobs.setdefault(dest_dir, []).extend(row_jobs)
+            for job in row_jobs:
+                job.keep_cached = True
+                copy_jobs.append(job)
+    for dest_dir, entity in entities.items():
+        entity[3] = expected_conversions(entity_jobs[dest_dir])
+
+    saved_at = start
+    completed = 0
+    total = len(copy_jobs) + sum(entity[3] for entity in entities.values())
+    futures = []
+
+    def advance(done=1, planned=0):
+        nonlocal completed, total
+        with lock:
+            completed += done
+            total += planned
+            if progress_callback:
+                progress_callback(completed, max(total, completed))
+
+    def convert(job):
+        if should_stop and should_stop():
+            advance()
+            return None
+        with lock:
+            if stats.first_conversion_at is None:
+                stats.first_conversion_at = time.monotonic() - start
+        result = run_with_retries(job, noesis_exe, flags, watchdog, retries, backoff, should_stop)
+        log_result(result, log_success, log_error)
+        advance()
+        return result
+
+    def copied(job, ok):
+        nonlocal saved_at
+        dest_dir = os.path.dirname(job.dest)
+        entity = entities[dest_dir]
+        if ok:
+            stats.copied += 1
+            entity[2].append(job.dest)
+        else:
+            stats.copy_failed += 1
+        entity[1] -= 1
+        if entity[1]:
+            return
+        stats.entities += 1
+        ready = entity_conversions(dest_dir, entity[2], version_name, entity[0], fbx_root)
+        if build_state is not None:
+            if not rebuild:
+                ready, current = split_outdated(ready, build_state, flags)
+                stats.up_to_date += len(current)
+            build_state.mark_queued(ready, flags)
+            # Written every few seconds, so a crash mid-run still leaves the queued outputs marked outdated
+            if time.monotonic() - saved_at > STATE_SAVE_INTERVAL:
+                build_state.save()
+                saved_at = time.monotonic()
+        if ready:
+            os.makedirs(os.path.dirname(ready[0].output), exist_ok=True)
+        advance(0, len(ready) - entity[3])
+        futures.extend(executor.submit(convert, conversion) for conversion in ready)
+
+    def copy_progress(done, copy_total):
+        advance()
+
+    with NoesisWatchdog(should_stop) as watchdog:
+        executor = ThreadPoolExecutor(max_workers=max(1, noesis_workers))
+        try:
+            await run_copy_jobs(copy_jobs, pools=pools or DevicePools(), throttle=throttle, log_success=log_success,
+                                log_error=log_error, progress_callback=copy_progress, should_stop=should_stop,
+                                job_callback=copied)
+            stats.copies_done_at = time.monotonic() - start
+        finally:
+            await asyncio.to_thread(executor.shutdown, True)
+    stats.results = [result for result in (future.result() for future in futures) if result is not None]
+    stats.seconds = time.monotonic() - start
+
+    if build_state is not None:
+        build_state.forget(result.job for result in stats.results if not result.ok)
+        build_state.save()
+    if metrics_path and stats.results:
+        record_metrics([job_metrics(result) for result in stats.results], metrics_path)
+    return stats
+
+
+def format_pipeline_stats(stats):
+    lines = [f"Copied {stats.copied} files ({stats.copy_failed} failed) into {stats.entities} entities in "
+             f"{stats.copies_done_at:.1f}s; {stats.up_to_date} FBX files already up to date",
+             format_run_summary(stats.results, stats.seconds)]
+    if stats.first_conversion_at is not None:
+        lines.append(f"First conversion started after {stats.first_conversion_at:.1f}s; copies and conversions "
+                     f"overlapped for {stats.overlap:.1f}s")
+    lines.extend(format_failure_report(failure_report(stats.results)))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy a version's entities into Sorted and convert each to FBX "
+                                                 "as soon as its files are in place")
+    parser.add_argument('version_path')
+    parser.add_argument('workbook', help="entity workbook with one sheet per entity type")
+    parser.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    parser.add_argument('--sorted-root', default=SORTED_ROOT)
+    parser.add_argument('--fbx-root', default=FBX_ROOT)
+    parser.add_argument('--noesis', default=NOESIS_EXE_PATH)
+    parser.add_argument('--workers', type=int, default=NOESIS_WORKERS, help="concurrent Noesis processes")
+    parser.add_argument('--copy-budget', type=int, default=None,
+                        help="concurrent copies per device, instead of the per-kind defaults")
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args(argv)
+
+    wb = openpyxl.load_workbook(args.workbook, read_only=True)
+    plans = []
+    for entity_type in args.types:
+        if entity_type not in wb.sheetnames:
+            logger.error(f"Sheet {entity_type} not found in {args.workbook}")
+            continue
+        plan = plan_entity_copies(wb[entity_type].iter_rows(min_row=2, values_only=True), args.version_path,
+                                  entity_type, args.sorted_root)
+        create_destination_folders(plan)
+        plans.append((entity_type, plan))
+
+    budgets = {kind: args.copy_budget for kind in DEVICE_BUDGETS} if args.copy_budget else None
+
+    def report_progress(completed, total):
+        sys.stderr.write(f"\r{completed}/{total} copies and conversions done")
+        sys.stderr.flush()
+
+    stats = asyncio.run(run_copy_convert_pipeline(plans, args.version_path, args.noesis, noesis_workers=args.workers,
+                                                  pools=DevicePools(budgets), fbx_root=args.fbx_root,
+                                                  build_state=FbxBuildState(), rebuild=args.rebuild,
+                                                  log_success=logger.debug, progress_callback=report_progress))
+    sys.stderr.write("\n")
+    for line in format_pipeline_stats(stats):
+        logger.info(line)
+    return 1 if stats.copy_failed or any(not result.ok for result in stats.results) else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import sys
+import shutil
+import logging
+import argparse
+
+from kathana_fbx import plan_fbx_version
+from kathana_store import ENTITY_TYPES
+from kathana_noesis import NOESIS_EXE_PATH
+from kathana_jobspec import plan_job_specs, bat_command, sh_command, bat_escape, bat_quote, sh_quote
+
+logger = logging.getLogger()
+
+# Marker files of finished jobs, shared by every shard of a batch so a rerun of the same scripts skips them
+DONE_DIR_SUFFIX = '.done'
+
+
+def balance_shards(jobs, costs, shards):
+    """Split jobs into shards with near-equal total cost, placing the costliest job on the lightest shard first."""
+    buckets = [[] for _ in range(max(1, shards))]
+    loads = [0.0] * len(buckets)
+    for job, cost in sorted(zip(jobs, costs), key=lambda pair: pair[1], reverse=True):
+        lightest = loads.index(min(loads))
+        buckets[lightest].append(job)
+        loads[lightest] += cost
+    return buckets, loads
+
+
+def shard_command(spec, noesis_var, quote_command):
+    """The command line of a Noesis spec, its tool replaced by the shard's overridable Noesis variable."""
+    argv = spec['argv']
+    if argv[0] == spec.get('tool'):
+        return f'"{noesis_var}" {quote_command(argv[1:])}'
+    # e.g. an interpreter running a Python stand-in; the spec's command is used as it is
+    return quote_command(argv)
+
+
+def write_bat_shard(path, specs, done_dir):
+    """Write a self-contained, resumable cmd script; it exits with the number of failed jobs.
+
+    Outputs are deleted before they are written, as they may be hard links into the FBX cache.
+    """
+    tool = next((spec['tool'] for spec in specs if spec['kind'] == 'noesis'), NOESIS_EXE_PATH)
+    with open(path, 'w') as f:
+        f.write("@echo off\nsetlocal\n")
+        f.write(f'if not defined NOESIS set "NOESIS={bat_escape(tool)}"\n')
+        f.write(f'set "DONE={bat_escape(done_dir)}"\n')
+        f.write('if not exist "%DONE%" mkdir "%DONE%"\nset FAILED=0\n')
+        for spec in specs:
+            output = bat_quote(spec['outputs'][0])
+            if spec['kind'] == 'noesis':
+                marker = f'"%DONE%\\{spec["id"]}"'
+                command = shard_command(spec, "%NOESIS%", bat_command)
+                f.write(f'if not exist {marker} ( del /F /Q {output} 2>nul & {command} '
+                        f'&& type nul > {marker} || set /a FAILED+=1 )\n')
+            else:
+                f.write(f'del /F /Q {output} 2>nul & copy /Y {bat_quote(spec["inputs"][0])} {output} >nul\n')
+        f.write('echo %FAILED% conversions failed\nexit /b %FAILED%\n')
+
+
+def write_sh_shard(path, specs, done_dir):
+    """Write a self-contained, resumable POSIX shell script; it exits non-zero if any job failed."""
+    tool = next((spec['tool'] for spec in specs if spec['kind'] == 'noesis'), NOESIS_EXE_PATH)
+    with open(path, 'w', newline='\n') as f:
+        f.write("#!/bin/sh\n")
+        f.write(f"NOESIS=\"${{NOESIS:-{tool}}}\"\n")
+        f.write(f"DONE={sh_quote(done_dir)}\n")
+        f.write('mkdir -p "$DONE"\nFAILED=0\n')
+        for spec in specs:
+            output = sh_quote(spec['outputs'][0])
+            if spec['kind'] == 'noesis':
+                marker = f'"$DONE/{spec["id"]}"'
+                command = shard_command(spec, "$NOESIS", sh_command)
+                f.write(f'[ -e {marker} ] || {{ rm -f {output}; {command} '
+                        f'&& : > {marker} || FAILED=$((FAILED + 1)); }}\n')
+            else:
+                f.write(f'rm -f {output}; cp -f {sh_quote(spec["inputs"][0])} {output}\n')
+        f.write('echo "$FAILED conversions failed"\n[ "$FAILED" -eq 0 ]\n')
+    os.chmod(path, 0o755)
+
+
+def write_shards(specs, shards, out_dir, name):
+    """Write <name>_shardNN.bat and .sh for each of the cost-balanced shards of a job list.
+
+    The scripts are exported from the same noesis and copy specs as the full
+    .bat and .sh. Copies go to the shard that converts their source, after its
+    conversions. Markers of the previous batch are cleared, since its jobs may
+    have been built from older inputs. Returns [(bat path, sh path, job count,
+    estimated cost)].
+    """
+    conversions = [spec for spec in specs if spec['kind'] == 'noesis']
+    buckets, loads = balance_shards(conversions, [spec['cost'] or 0.0 for spec in conversions], shards)
+    shard_of = {spec['outputs'][0]: index for index, bucket in enumerate(buckets) for spec in bucket}
+    shard_copies = [[] for _ in buckets]
+    for spec in specs:
+        if spec['kind'] == 'copy':
+            shard_copies[shard_of.get(spec['inputs'][0], 0)].append(spec)
+
+    os.makedirs(out_dir, exist_ok=True)
+    done_dir = os.path.join(out_dir, name + DONE_DIR_SUFFIX)
+    shutil.rmtree(done_dir, ignore_errors=True)
+    written = []
+    for index, bucket in enumerate(buckets):
+        stem = os.path.join(out_dir, f"{name}_shard{index + 1:02d}")
+        write_bat_shard(stem + ".bat", bucket + shard_copies[index], done_dir)
+        write_sh_shard(stem + ".sh", bucket + shard_copies[index], done_dir)
+        written.append((stem + ".bat", stem + ".sh", len(bucket), loads[index]))
+    return written
+
+
+def format_shards(written):
+    lines = []
+    for bat_path, sh_path, count, load in written:
+        lines.append(f"{os.path.basename(bat_path)[:-4]}: {count} jobs, estimated cost {load:.1f}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a version's FBX conversions into cost-balanced shard scripts")
+    parser.add_argument('version_path')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    parser.add_argument('--out', default=None, help="directory for the scripts (default: the Sorted version folder)")
+    parser.add_argument('--noesis', default=NOESIS_EXE_PATH)
+    args = parser.parse_args(argv)
+
+    specs = plan_job_specs(plan_fbx_version(args.version_path, args.types), noesis_exe=args.noesis)
+    out_dir = args.out or os.path.join(r"B:\\Kathana-Out\\Sorted", os.path.basename(args.version_path))
+    written = write_shards(specs, args.shards, out_dir, "generate_all_fbx")
+    for line in format_shards(written):
+        logger.info(line)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from dataclasses import dataclass
+
+from kathana_fbx import plan_fbx_version
+from kathana_store import STORE_ROOT, ENTITY_TYPES
+from kathana_metrics import NOESIS_METRICS_PATH, load_metrics, input_bytes
+
+logger = logging.getLogger()
+
+# Hand-maintained skeletons: {"<file>" or "<type>/<file>": "<skeleton id>" or {"skeleton": ..., "bones": ...}}
+SKELETONS_PATH = os.path.join(os.getcwd(), "KATHANA_SKELETONS.json")
+SKIPPED_PAIRS_DIR = os.path.join(STORE_ROOT, "skipped_pairs")
+
+
+@dataclass
+class Skeleton:
+    """What is known about the skeleton a mesh has or an animation drives."""
+    bones: int = None
+    skeleton: str = None
+
+
+def compatible(mesh, anim):
+    """True or False when the two skeletons can be compared, None when too little is known."""
+    if mesh is None or anim is None:
+        return None
+    if mesh.skeleton and anim.skeleton:
+        return mesh.skeleton == anim.skeleton
+    if mesh.bones is not None and anim.bones is not None:
+        return mesh.bones == anim.bones
+    return None
+
+
+def path_key(path):
+    return path.replace('\\', '/').lower()
+
+
+class SkeletonIndex:
+    """Hand-maintained skeletons of .tmb and .tab files, plus the pairs Noesis failed to convert.
+
+    The .tmb and .tab headers are not parsed, so this is a failure-history
+    filter rather than a skeleton check: only the manual file compares
+    skeletons. Manual entries are keyed "<type>/<file>" or "<file>", the former
+    taking precedence. A mesh also gets the bone count Noesis reported for it,
+    keyed by its full path, which the manual file can be compared against.
+    A pair is remembered as failed only when Noesis itself exited with an
+    error; launch errors and killed runs prove nothing. A failure is forgotten
+    once the pair converts, or once its inputs change size.
+    """
+
+    def __init__(self):
+        self.files = {}
+        # (tmb key, tab key) -> input bytes of the pair's last failed conversion
+        self.failed = {}
+
+    def lookup(self, path, entity_type=''):
+        name = os.path.basename(path).lower()
+        return (self.files.get(f"{entity_type.lower()}/{name}") or self.files.get(name)
+                or self.files.get(path_key(path)))
+
+    def failed_before(self, job):
+        """True if the pair failed to convert with the inputs it has now."""
+        return self.failed.get((path_key(job.tmb), path_key(job.tab))) == input_bytes(job)
+
+    def learn_metrics(self, records):
+        for record in records:
+            if record.get('bones') is not None:
+                self.files[path_key(record['tmb'])] = Skeleton(bones=record['bones'])
+            # A multi-animation job cannot say which of its animations failed, and a killed one proves nothing
+            if record.get('animations', 1) != 1 or record.get('killed'):
+                continue
+            pair = (path_key(record['tmb']), path_key(record['tab']))
+            if record['returncode'] == 0:
+                self.failed.pop(pair, None)
+            elif record['returncode'] > 0:
+                # Negative codes are launch errors or signals, not Noesis rejecting the pair
+                self.failed[pair] = record.get('input_bytes')
+
+    def load_manual(self, path=SKELETONS_PATH):
+        try:
+            with open(path) as f:
+                manual = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        for key, value in manual.items():
+            if isinstance(value, str):
+                value = {'skeleton': value}
+            self.files[key.replace('\\', '/').lower()] = Skeleton(value.get('bones'), value.get('skeleton'))
+        return len(manual)
+
+    @classmethod
+    def load(cls, metrics_path=NOESIS_METRICS_PATH, skeletons_path=SKELETONS_PATH):
+        index = cls()
+        index.learn_metrics(load_metrics(metrics_path))
+        index.load_manual(skeletons_path)
+        return index
+
+
+def describe(skeleton):
+    if skeleton.skeleton:
+        return f"skeleton {skeleton.skeleton}"
+    return f"{skeleton.bones} bones"
+
+
+def filter_compatible_pairs(jobs, index, retry_failed=False):
+    """Drop the jobs whose skeletons the manual file says differ, or that failed before with the same inputs.
+
+    Pairs with an unknown side are kept; with retry_failed, pairs that failed
+    before are kept too, so a forced rebuild can clear their failures.
+    Returns (kept jobs, [(job, reason)]).
+    """
+    kept = []
+    skipped = []
+    for job in jobs:
+        mesh = index.lookup(job.tmb, job.entity_type)
+        anim = index.lookup(job.tab, job.entity_type)
+        if compatible(mesh, anim) is False:
+            skipped.append((job, f"{os.path.basename(job.tmb)} has {describe(mesh)}, "
+                                 f"{os.path.basename(job.tab)} has {describe(anim)}"))
+        elif not retry_failed and index.failed_before(job):
+            skipped.append((job, f"{os.path.basename(job.tmb)} and {os.path.basename(job.tab)} failed to convert "
+                                 f"together before"))
+        else:
+            kept.append(job)
+    return kept, skipped
+
+
+def skipped_pairs_path(version_name, skipped_dir=SKIPPED_PAIRS_DIR):
+    return os.path.join(skipped_dir, f"{version_name}.json")
+
+
+def save_skipped_pairs(version_path, skipped, skipped_dir=SKIPPED_PAIRS_DIR):
+    os.makedirs(skipped_dir, exist_ok=True)
+    with open(skipped_pairs_path(os.path.basename(version_path), skipped_dir), 'w') as f:
+        json.dump({'version': version_path,
+                   'skipped': [{'tmb': job.tmb, 'tab': job.tab, 'output': job.output, 'reason': reason}
+                               for job, reason in skipped]}, f, indent=1)
+
+
+def format_skipped_pairs(skipped, limit=20):
+    lines = [f"{len(skipped)} mesh/animation pairs skipped for manual skeleton mismatches or earlier failures"] if skipped else []
+    for job, reason in skipped[:limit]:
+        lines.append(f"  {job.entity_type}/{job.folder}: {reason}")
+    if len(skipped) > limit:
+        lines.append(f"  ... and {len(skipped) - limit} more")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the mesh/animation pairs of a staged version whose manual "
+                                                 "skeletons differ or that Noesis failed to convert")
+    parser.add_argument('version_path')
+    parser.add_argument('--types', nargs='+', default=list(ENTITY_TYPES))
+    parser.add_argument('--skeletons', default=SKELETONS_PATH)
+    parser.add_argument('--metrics', default=NOESIS_METRICS_PATH)
+    parser.add_argument('--retry-failed', action='store_true', help="keep pairs that failed before")
+    args = parser.parse_args(argv)
+
+    index = SkeletonIndex.load(args.metrics, args.skeletons)
+    jobs = plan_fbx_version(args.version_path, args.types)
+    kept, skipped = filter_compatible_pairs(jobs, index, args.retry_failed)
+    save_skipped_pairs(args.version_path, skipped)
+    logger.info(f"{len(index.files)} skeletons and {len(index.failed)} failed pairs known; "
+                f"{len(kept)} of {len(jobs)} pairs kept")
+    for line in format_skipped_pairs(skipped, limit=len(skipped)):
+        logger.info(line)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
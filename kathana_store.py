@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import stat
+import shutil
+import logging
+import threading
+import argparse
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from kathana_digest import DigestCache
+
+logger = logging.getLogger()
+
+STORE_ROOT = r"B:\\Kathana-Out\\Store"
+ENTITY_TYPES = ('PC', 'NPC', 'Monster')
+ASSET_FOLDERS = ('Mesh', 'Ani')
+
+
+def asset_key(version_path, path):
+    """Manifest key of an asset: its path below the version root, lower-case with forward slashes."""
+    return os.path.relpath(path, version_path).replace('\\', '/').lower()
+
+
+def iter_version_assets(version_path, entity_types=ENTITY_TYPES):
+    """Yield (path, os.stat_result) for every Mesh and Ani file of a version."""
+    for entity_type in entity_types:
+        for folder in ASSET_FOLDERS:
+            directory = os.path.join(version_path, "resource", "object", entity_type, folder)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            yield entry.path, entry.stat()
+            except OSError as e:
+                logger.debug(f"Could not scan {directory}: {e}")
+
+
+@dataclass
+class IngestStats:
+    """Outcome of ingesting one version into the store."""
+    files: int = 0
+    new_objects: int = 0
+    bytes_added: int = 0
+    bytes_shared: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+class ObjectStore:
+    """Content-addressed asset store shared by every Kathana version.
+
+    Each distinct file is kept once under objects/<2 hex>/<digest>; a version is
+    a manifest mapping its asset paths to digests, and Sorted trees are hard-link
+    views of the objects.
+    """
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifests_dir = os.path.join(root, "manifests")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def manifest_path(self, version_name):
+        return os.path.join(self.manifests_dir, f"{version_name}.json")
+
+    def load_manifest(self, version_name):
+        """Return {asset key: digest} for an ingested version, or None if it was never ingested."""
+        try:
+            with open(self.manifest_path(version_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_manifest(self, version_name, manifest):
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        tmp_path = self.manifest_path(version_name) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path(version_name))
+
+    def add_object(self, path, digest):
+        """Store a file under its digest unless an identical object exists; returns True if it was added."""
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            return False
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # Objects are private copies; linking the version file would let an in-place edit corrupt the store
+        tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        # Read-only, so a tool writing into a Sorted file fails instead of changing every version's object
+        os.chmod(tmp_path, stat.S_IREAD)
+        try:
+            os.replace(tmp_path, object_path)
+        except OSError:
+            # Another ingest stored the same content first
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def ingest_version(self, version_path, max_workers=8, progress_callback=None, cache=None):
+        """Hash every Mesh and Ani file of a version into the store and save its manifest.
+
+        Digests come from the persistent digest cache, so re-ingesting an
+        untouched version only stats its files.
+        """
+        version_name = os.path.basename(version_path)
+        assets = list(iter_version_assets(version_path))
+        stats = IngestStats(files=len(assets))
+        manifest = {}
+        own_cache = cache is None
+        cache = cache or DigestCache()
+        try:
+            digests = cache.digests(assets)
+        finally:
+            if own_cache:
+                cache.close()
+        stats.cache_hits = cache.hits
+        stats.cache_misses = cache.misses
+
+        def ingest(asset):
+            path, st = asset
+            digest = digests[path]
+            return path, st.st_size, digest, self.add_object(path, digest)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for done, (path, size, digest, added) in enumerate(executor.map(ingest, assets), start=1):
+                manifest[asset_key(version_path, path)] = digest
+                if added:
+                    stats.new_objects += 1
+                    stats.bytes_added += size
+                else:
+                    stats.bytes_shared += size
+                if progress_callback:
+                    progress_callback(done, stats.files)
+
+        self.save_manifest(version_name, manifest)
+        return stats
+
+    def link_object(self, digest, dest):
+        """Make dest a hard link to a stored object, copying when linking is not possible."""
+        object_path = self.object_path(digest)
+        if os.path.lexists(dest):
+            remove_file(dest)
+        try:
+            os.link(object_path, dest)
+        except OSError:
+            shutil.copyfile(object_path, dest)
+
+
+def remove_file(path):
+    """Remove path even if it is a read-only link to a store object."""
+    try:
+        os.remove(path)
+    except PermissionError:
+        # Windows refuses to delete read-only files; only the name goes, the object keeps its data
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        os.remove(path)
+
+
+def link_plan_from_store(plan, store, version_path, max_workers=8, log_success=logger.info, log_error=logger.error,
+                         progress_callback=None):
+    """Materialise a copy plan as hard links into the store instead of copying data.
+
+    The destination folders must already exist. Returns (linked, unresolved); jobs
+    whose source is not in the version's manifest are unresolved.
+    """
+    manifest = store.load_manifest(os.path.basename(version_path)) or {}
+    total = len(plan.jobs)
+
+    def link(job):
+        digest = manifest.get(asset_key(version_path, job.src))
+        if digest is None:
+            log_error(f"Not in store: {job.src}")
+            return False
+        try:
+            store.link_object(digest, job.dest)
+        except OSError as e:
+            log_error(f"Error linking {job.dest} from store: {e}")
+            return False
+        log_success(f"Linked {job.dest} from store")
+        return True
+
+    linked = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for done, ok in enumerate(executor.map(link, plan.jobs), start=1):
+            linked += ok
+            if progress_callback:
+                progress_callback(done, total)
+    return linked, total - linked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kathana content-addressed asset store")
+    parser.add_argument('--store', default=STORE_ROOT)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('ingest', help="hash a version's Mesh and Ani files into the store")
+    p.add_argument('version_paths', nargs='+')
+    p.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    store = ObjectStore(args.store)
+    if args.command == 'ingest':
+        for version_path in args.version_paths:
+            stats = store.ingest_version(version_path, max_workers=args.workers)
+            logger.info(f"{os.path.basename(version_path)}: {stats.files} files, {stats.new_objects} new objects "
+                        f"({stats.bytes_added / 1024 ** 2:.1f} MB added, {stats.bytes_shared / 1024 ** 2:.1f} MB shared, "
+                        f"{stats.cache_hits} cached digests)")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())